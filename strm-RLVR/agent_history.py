@@ -0,0 +1,82 @@
+"""
+Bounded agent histories
+RingBuffer keeps the newest `capacity` records and drops the oldest, so a VoxelAgent's
+memory and prompt size stay flat over long runs. Every record gets a sequence number
+that keeps counting past evictions, which lets callers ask for "what arrived since".
+"""
+
+from typing import Callable, Generic, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class MessageRecord:
+    """One chat message in an agent's history"""
+    __slots__ = ("agent", "content", "mode")
+
+    def __init__(self, agent: str, content: str, mode):
+        self.agent = agent
+        self.content = content
+        self.mode = mode
+
+    def __repr__(self) -> str:
+        return f"MessageRecord({self.agent!r}, {self.content[:30]!r}, {self.mode})"
+
+
+class ActionRecord:
+    """One executed action and where it left the agent"""
+    __slots__ = ("action", "label", "x", "y", "z")
+
+    def __init__(self, action, label: str, x: float, y: float, z: float):
+        self.action = action
+        self.label = label
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __repr__(self) -> str:
+        return f"ActionRecord({self.label}, ({self.x:.0f}, {self.y:.0f}, {self.z:.0f}))"
+
+
+class RingBuffer(Generic[T]):
+    """Fixed-capacity history, oldest first when iterated"""
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0  # records ever appended; the next record's sequence number
+        self._items: List[Optional[T]] = [None] * capacity
+
+    def __len__(self) -> int:
+        return min(self.total, self.capacity)
+
+    def append(self, item: T) -> int:
+        """Store item, evicting the oldest when full; returns its sequence number"""
+        seq = self.total
+        self._items[seq % self.capacity] = item
+        self.total += 1
+        return seq
+
+    def __iter__(self) -> Iterator[T]:
+        return self.since(0)
+
+    def since(self, seq: int) -> Iterator[T]:
+        """Records with sequence number >= seq that are still retained"""
+        for i in range(max(seq, self.total - len(self)), self.total):
+            yield self._items[i % self.capacity]
+
+    def latest(self) -> Optional[T]:
+        return self._items[(self.total - 1) % self.capacity] if self.total else None
+
+    def last(self, k: int, where: Optional[Callable[[T], bool]] = None) -> List[T]:
+        """Newest k records (matching `where`), oldest first; stops scanning once k are found"""
+        out: List[T] = []
+        for i in range(self.total - 1, self.total - len(self) - 1, -1):
+            if len(out) >= k:
+                break
+            item = self._items[i % self.capacity]
+            if where is None or where(item):
+                out.append(item)
+        out.reverse()
+        return out
@@ -0,0 +1,104 @@
+"""
+Completion cache for chat requests
+Keyed by a canonical hash of the request (model, messages, temperature, max_tokens, ...),
+with an in-memory LRU in front of an optional SQLite file so repeated runs start warm.
+At temperature > 0 a key holds up to `samples` completions: lookups miss until that many
+are stored, then cycle through them round-robin so cached runs keep some variety.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def request_key(request: Dict) -> str:
+    """sha256 of the request as sorted, compact JSON"""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """LRU + SQLite cache of completion texts; safe to share between threads"""
+
+    def __init__(self, path: Optional[str] = None, capacity: int = 1024, samples: int = 1):
+        self.capacity = capacity
+        self.samples = max(1, samples)
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0  # hits that had to be loaded from SQLite first
+        self._memory: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS completions ("
+                             "key TEXT NOT NULL, idx INTEGER NOT NULL, value TEXT NOT NULL, "
+                             "PRIMARY KEY (key, idx))")
+            self._db.commit()
+
+    def _wanted(self, request: Dict) -> int:
+        return self.samples if request.get("temperature", 1.0) > 0 else 1
+
+    def _load(self, key: str) -> Optional[List[str]]:
+        values = self._memory.get(key)
+        if values is not None:
+            self._memory.move_to_end(key)
+            return values
+        if self._db is None:
+            return None
+        rows = self._db.execute("SELECT value FROM completions WHERE key = ? ORDER BY idx", (key,)).fetchall()
+        if not rows:
+            return None
+        values = [row[0] for row in rows]
+        self._remember(key, values)
+        return values
+
+    def _remember(self, key: str, values: List[str]):
+        self._memory[key] = values
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            old, _ = self._memory.popitem(last=False)
+            self._cursor.pop(old, None)
+
+    def get(self, request: Dict) -> Optional[str]:
+        """Cached completion for the request, or None if it should be fetched (and put)"""
+        key = request_key(request)
+        with self._lock:
+            in_memory = key in self._memory
+            values = self._load(key)
+            if values is None or len(values) < self._wanted(request):
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not in_memory:
+                self.disk_hits += 1
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            return values[i % len(values)]
+
+    def put(self, request: Dict, value: str):
+        key = request_key(request)
+        with self._lock:
+            values = list(self._load(key) or [])
+            if len(values) >= self._wanted(request):
+                return
+            values.append(value)
+            self._remember(key, values)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO completions (key, idx, value) VALUES (?, ?, ?)",
+                                 (key, len(values) - 1, value))
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "entries": len(self._memory)}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -8,9 +8,12 @@ Each agent streams tokens and can choose between:
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
+import json
+from contextlib import closing
 from typing import List, Dict, Optional, Iterator
 from enum import Enum
 from dataclasses import dataclass
+from completion_cache import CompletionCache
 
 load_dotenv()
 
@@ -60,10 +63,11 @@ class TokenBuffer:
 
 
 class Agent:
-    def __init__(self, name: str, client: OpenAI, model: str = "gpt-4"):
+    def __init__(self, name: str, client: OpenAI, model: str = "gpt-4", cache: Optional[CompletionCache] = None):
         self.name = name
         self.client = client
         self.model = model
+        self.cache = cache
         self.current_mode = StreamMode.INTERNAL
         self.message_history: List[Message] = []
         self.current_buffer = ""
@@ -180,23 +184,16 @@ You start in INTERNAL mode by default. Other agents cannot see your internal tho
         print(f"\n{'='*60}")
         print(f"[{self.name}] SENDING TO OPENAI:")
         print(f"{'='*60}")
-        import json
         print(json.dumps(messages, indent=2))
         print(f"{'='*60}\n")
 
         # Create a NEW stream with updated context
-        stream = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            stream=True,
-            temperature=0.7
-        )
+        request = {"model": self.model, "messages": messages, "stream": True, "temperature": 0.7}
 
         # Get first chunk with content
         self.current_buffer = ""
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
+        with closing(self._stream_chunks(request)) as chunks:
+            for content in chunks:
                 self.current_buffer += content
 
                 # Check for tool switches
@@ -245,15 +242,43 @@ You start in INTERNAL mode by default. Other agents cannot see your internal tho
         # Stream ended with no tokens
         return None
 
+    def _stream_chunks(self, request: Dict) -> Iterator[str]:
+        """Content pieces of a streamed completion, replayed from the cache when possible
+
+        Only the pieces actually read get cached (generate_next_token stops at its first
+        token), so a replay behaves exactly like the original stream.
+        """
+        if self.cache:
+            cached = self.cache.get(request)
+            if cached is not None:
+                yield from json.loads(cached)
+                return
+        seen = []
+        try:
+            for chunk in self.client.chat.completions.create(**request):
+                content = chunk.choices[0].delta.content
+                if content:
+                    seen.append(content)
+                    yield content
+        except GeneratorExit:
+            if self.cache:
+                self.cache.put(request, json.dumps(seen))
+            raise
+        if self.cache:
+            self.cache.put(request, json.dumps(seen))
+
 
 class MultiAgentSystem:
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, model: str = "gpt-4", cache: Optional[CompletionCache] = None,
+                 base_url: Optional[str] = None):
+        # base_url points the agents at any OpenAI-compatible server, e.g. tiny-llm/serve_gpt.py
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
         self.model = model
+        self.cache = cache
         self.agents: Dict[str, Agent] = {}
 
     def add_agent(self, name: str) -> Agent:
-        agent = Agent(name, self.client, self.model)
+        agent = Agent(name, self.client, self.model, cache=self.cache)
         self.agents[name] = agent
         print(f"✅ Added agent: {name}")
         return agent
@@ -340,12 +365,13 @@ class MultiAgentSystem:
 
 
 async def demo():
-    api_key = os.getenv("OPENAI_API_KEY")
+    base_url = os.getenv("OPENAI_BASE_URL")  # e.g. http://127.0.0.1:8001/v1 for a local tiny-llm model
+    api_key = os.getenv("OPENAI_API_KEY") or ("local" if base_url else None)
     if not api_key:
         print("⚠️  Please set OPENAI_API_KEY in .env file")
         return
 
-    system = MultiAgentSystem(api_key, model="gpt-4")
+    system = MultiAgentSystem(api_key, model="gpt-4", base_url=base_url)
 
     system.add_agent("Alice")
     system.add_agent("Bob")
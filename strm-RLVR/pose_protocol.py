@@ -0,0 +1,121 @@
+"""
+Compact pose frames for spectators
+A JSON pos event repeats clientId, room, name and color on every step. Subscribers that
+ask for compact poses (/events?room=...&poses=compact) instead get one "join" event per
+client carrying a small integer id plus name and color, then pose frames of POSE_FRAME
+records: id, fixed-point x/y/z and quantized yaw/pitch, base64-packed into the SSE data
+line behind FRAME_PREFIX. voxelcraft/main.js decodes the same layout with a DataView.
+"""
+
+import base64
+import json
+import math
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# id (u16), x (i32), y (i16), z (i32), yaw (u8, full turn / 256), pitch (i8, quarter turn / 127)
+POSE_FRAME = "<HihiBb"
+POSE_SCALE = 16  # fixed-point steps per block
+FRAME_PREFIX = "P"  # JSON events start with "{", so one character tells them apart
+MAX_POSE_ID = 0xFFFF
+
+_FRAME = struct.Struct(POSE_FRAME)
+_Y_LIMIT = 0x7FFF
+
+
+def _fixed(v) -> int:
+    return int(round(float(v or 0) * POSE_SCALE))
+
+
+def pack_pose(pose_id: int, x, y, z, yaw, pitch) -> bytes:
+    """One POSE_FRAME record; y is clamped to what an i16 holds (+-2048 blocks)"""
+    yaw_q = int(round((float(yaw or 0) % (2 * math.pi)) / (2 * math.pi) * 256)) & 0xFF
+    pitch_q = max(-127, min(127, int(round(float(pitch or 0) / (math.pi / 2) * 127))))
+    return _FRAME.pack(pose_id, _fixed(x), max(-_Y_LIMIT, min(_Y_LIMIT, _fixed(y))), _fixed(z), yaw_q, pitch_q)
+
+
+def unpack_poses(data: bytes) -> List[Tuple[int, float, float, float, float, float]]:
+    """(id, x, y, z, yaw, pitch) for every record in data"""
+    out = []
+    for pose_id, x, y, z, yaw_q, pitch_q in _FRAME.iter_unpack(data[:len(data) - len(data) % _FRAME.size]):
+        out.append((pose_id, x / POSE_SCALE, y / POSE_SCALE, z / POSE_SCALE,
+                    yaw_q * 2 * math.pi / 256, pitch_q * (math.pi / 2) / 127))
+    return out
+
+
+def encode_frames(data: bytes) -> str:
+    """SSE data text for packed records"""
+    return FRAME_PREFIX + base64.b64encode(data).decode("ascii")
+
+
+def decode_frames(text: str) -> bytes:
+    return base64.b64decode(text[len(FRAME_PREFIX):])
+
+
+class PoseTable:
+    """Per-room clientId -> pose id table; ids of clients that left are reused"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._info: Dict[int, Dict] = {}
+        self._free: List[int] = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def assign(self, client_id: str, name, color) -> Tuple[Optional[int], Optional[Dict]]:
+        """(pose id, join event to broadcast or None if nothing changed); id is None when the table is full"""
+        with self._lock:
+            pose_id = self._ids.get(client_id)
+            if pose_id is None:
+                if self._free:
+                    pose_id = self._free.pop()
+                elif self._next <= MAX_POSE_ID:
+                    pose_id = self._next
+                    self._next += 1
+                else:
+                    return None, None
+                self._ids[client_id] = pose_id
+            info = self._info.get(pose_id)
+            if info is not None and info["name"] == name and info["color"] == color:
+                return pose_id, None
+            info = {"type": "join", "id": pose_id, "clientId": client_id, "name": name, "color": color}
+            self._info[pose_id] = info
+            return pose_id, info
+
+    def release(self, client_id: str) -> Optional[int]:
+        with self._lock:
+            pose_id = self._ids.pop(client_id, None)
+            if pose_id is not None:
+                del self._info[pose_id]
+                self._free.append(pose_id)
+            return pose_id
+
+    def joins(self) -> List[Dict]:
+        """Join events for everyone currently in the table, for a new subscriber"""
+        with self._lock:
+            return list(self._info.values())
+
+
+def benchmark(updates: int = 100000):
+    """Compare SSE bytes per pose update, JSON vs compact, and time the encoder"""
+    import time
+    agent = {"type": "pos", "clientId": "Alice_1a2b3c4d", "room": "ai_agents", "name": "Alice",
+             "x": 12, "y": 121, "z": -7, "yaw": 0.7853981633974483, "pitch": 0.0, "color": "#ff0000"}
+    browser = {"type": "pos", "room": "alpha", "clientId": "client_1760000000000_12345",
+               "x": 103.41816329956055, "y": 87.90000000000001, "z": -12.583491325378418,
+               "yaw": 2.3312000000000004, "pitch": -0.3120000000000001, "name": "Bob",
+               "color": [0.8573456239700317, 0.21049487590789795, 0.6132287979125977]}
+    compact = len(f"data: {encode_frames(pack_pose(3, 12, 121, -7, 0.785, 0.0))}\n\n")
+    for label, evt in (("agent", agent), ("browser", browser)):
+        size = len(f"data: {json.dumps(evt)}\n\n")
+        print(f"{label} pose: {size} B as JSON, {compact} B compact ({size / compact:.1f}x smaller)")
+    start = time.perf_counter()
+    for i in range(updates):
+        encode_frames(pack_pose(i & 0xFF, i * 0.1, 64.5, -i * 0.1, i * 0.01, 0.2))
+    elapsed = time.perf_counter() - start
+    print(f"{updates} frames encoded in {elapsed:.2f}s: {updates / elapsed:,.0f} frames/sec")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -10,10 +10,13 @@ voxelcraft directory and opening the browser to the correct URL.
 
 Usage:
   python3 run_voxelcraft.py
+  python3 run_voxelcraft.py --data-dir world_data   # keep rooms across restarts
 
 Notes:
   - If port 8000 is busy, it will try the next available port.
   - Press Ctrl+C to stop the server.
+  - With --data-dir, edits and seeds are written to a per-room log that is
+    fsynced every --commit-ms and compacted into a snapshot (see room_store.py).
 """
 import argparse
 import contextlib
@@ -22,12 +25,17 @@ import json
 import os
 import socket
 import socketserver
+import struct
 import sys
 import threading
 import time
 import urllib.parse
 import webbrowser
 
+from pose_protocol import PoseTable, encode_frames, pack_pose
+from room_store import RoomStore, edit_error, seed_error
+from spatial_index import ChunkIndex, clamp_radius
+
 
 def find_open_port(start=8000, end=8100, host="127.0.0.1"):
     """Find an available TCP port between start and end (inclusive)."""
@@ -49,19 +57,38 @@ class ReuseTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
 
 SSE_CLIENTS = {}  # room -> set(handlers)
 WORLD_ROOMS = {}  # room -> { seed, edits, clients }
+ROOM_STORE = None  # RoomStore when --data-dir is given, else rooms are memory-only
+ROOM_INDEX = {}  # room -> ChunkIndex over that room's edits
+POSE_TABLES = {}  # room -> PoseTable, ids for compact pose subscribers
 
 
 def room_state(room: str):
     return WORLD_ROOMS.setdefault(room, {"seed": None, "edits": {}, "clients": {}})
 
 
-def sse_broadcast(room: str, payload: dict):
+def room_index(room: str) -> ChunkIndex:
+    index = ROOM_INDEX.get(room)
+    if index is None:
+        index = ROOM_INDEX.setdefault(room, ChunkIndex(room_state(room)["edits"]))
+    return index
+
+
+def pose_table(room: str) -> PoseTable:
+    table = POSE_TABLES.get(room)
+    if table is None:
+        table = POSE_TABLES.setdefault(room, PoseTable())
+    return table
+
+
+def sse_broadcast(room: str, payload: dict, compact: str = None):
+    """Send payload to the room; subscribers that asked for compact poses get `compact` instead when given"""
     data = f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+    compact_data = f"data: {compact}\n\n".encode("ascii") if compact is not None else data
     clients = SSE_CLIENTS.get(room, set())
     dead = []
     for h in list(clients):
         try:
-            h.wfile.write(data)
+            h.wfile.write(compact_data if getattr(h, "_compact_poses", False) else data)
             h.wfile.flush()
         except Exception:
             dead.append(h)
@@ -76,6 +103,9 @@ def main():
     parser = argparse.ArgumentParser(description="Serve the Voxelcraft demo")
     parser.add_argument("--host", default="127.0.0.1", help="Host interface to bind (default: 127.0.0.1)")
     parser.add_argument("--port", type=int, default=None, help="Port to bind (default: auto from 8000..8100)")
+    parser.add_argument("--data-dir", default=None, help="Persist rooms under this directory (default: in-memory only)")
+    parser.add_argument("--commit-ms", type=int, default=50, help="Group-commit interval for the edit log in ms (default: 50)")
+    parser.add_argument("--compact-every", type=int, default=50000, help="Compact a room's log into a snapshot after this many records (default: 50000)")
     args = parser.parse_args()
 
     repo_root = os.path.dirname(os.path.abspath(__file__))
@@ -86,6 +116,16 @@ def main():
         print("Error: voxelcraft/index.html not found. Run this from the repo that contains the 'voxelcraft' folder.")
         sys.exit(1)
 
+    global ROOM_STORE
+    if args.data_dir:
+        ROOM_STORE = RoomStore(args.data_dir, WORLD_ROOMS, commit_ms=args.commit_ms,
+                               compact_every=args.compact_every)
+        restored = ROOM_STORE.load(room_state)
+        for room, state in WORLD_ROOMS.items():
+            ROOM_INDEX[room] = ChunkIndex(state["edits"])
+        ROOM_STORE.start()
+        print(f"Persisting rooms to {ROOM_STORE.data_dir} ({restored} restored)")
+
     os.chdir(vc_dir)
     host = args.host
     if args.port is not None:
@@ -110,8 +150,14 @@ def main():
                 self.send_header("Cache-Control", "no-cache")
                 self.send_header("Connection", "keep-alive")
                 self.end_headers()
+                self._compact_poses = qs.get('poses', [''])[0] == 'compact'
                 SSE_CLIENTS.setdefault(room, set()).add(self)
                 self._room = room
+                if self._compact_poses:
+                    # Ids and names of everyone already here; their poses arrive as frames
+                    for join in pose_table(room).joins():
+                        self.wfile.write(f"data: {json.dumps(join)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
                 # heartbeat to keep connection open
                 try:
                     while True:
@@ -133,6 +179,23 @@ def main():
                 self.end_headers()
                 self.wfile.write(json.dumps(room_state(room)).encode("utf-8"))
                 return
+            if self.path.startswith("/region"):
+                # Edits in the chunks within r of (cx, cz); chunks are CHUNK x CHUNK columns
+                try:
+                    cx = int(qs.get('cx', ['0'])[0])
+                    cz = int(qs.get('cz', ['0'])[0])
+                    r = int(qs.get('r', ['0'])[0])
+                except ValueError:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                r = clamp_radius(r)
+                resp = {"cx": cx, "cz": cz, "r": r, "edits": room_index(room).query(cx, cz, r)}
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps(resp).encode("utf-8"))
+                return
             return super().do_GET()
 
         def do_POST(self):
@@ -148,9 +211,24 @@ def main():
                 cid = evt.get("clientId")
                 room = evt.get("room") or 'default'
                 state = room_state(room)
+                compact = None
+                error = None
+                if t == "seed" and not state["seed"]:
+                    error = seed_error(evt.get("seed"))
+                elif t == "edit" and isinstance(evt.get("key"), str) and isinstance(evt.get("id"), int):
+                    error = edit_error(evt["key"], evt["id"])
+                if error:
+                    # rejected before any state changes, so memory, index and log stay in step
+                    self.send_response(400)
+                    self.send_header("Content-Type", "application/json")
+                    self.end_headers()
+                    self.wfile.write(json.dumps({"error": error}).encode("utf-8"))
+                    return
                 if t == "seed":
                     if not state["seed"]:
                         state["seed"] = evt.get("seed")
+                        if ROOM_STORE and state["seed"]:
+                            ROOM_STORE.append_seed(room, state["seed"])
                 elif t == "pos" and cid:
                     state["clients"][cid] = {
                         "x": evt.get("x"),
@@ -161,6 +239,15 @@ def main():
                         "yaw": evt.get("yaw"),
                         "pitch": evt.get("pitch"),
                     }
+                    pose_id, join = pose_table(room).assign(cid, evt.get("name"), evt.get("color"))
+                    if join is not None:
+                        sse_broadcast(room, join)
+                    if pose_id is not None:
+                        try:
+                            compact = encode_frames(pack_pose(pose_id, evt.get("x"), evt.get("y"), evt.get("z"),
+                                                              evt.get("yaw"), evt.get("pitch")))
+                        except (TypeError, ValueError, OverflowError, struct.error):
+                            compact = None  # not finite numbers in range; compact subscribers get the JSON event
                 elif t == "edit":
                     key = evt.get("key")
                     bid = evt.get("id")
@@ -169,10 +256,14 @@ def main():
                             state["edits"].pop(key, None)
                         else:
                             state["edits"][key] = bid
+                        room_index(room).set(key, bid)
+                        if ROOM_STORE:
+                            ROOM_STORE.append_edit(room, key, bid)
                 elif t == "leave" and cid:
                     state["clients"].pop(cid, None)
+                    pose_table(room).release(cid)
                 # broadcast to all subscribers
-                sse_broadcast(room, evt)
+                sse_broadcast(room, evt, compact)
                 self.send_response(200)
                 self.send_header("Content-Type", "application/json")
                 self.end_headers()
@@ -236,6 +327,8 @@ def main():
         print("\nShutting down...")
     finally:
         httpd.server_close()
+        if ROOM_STORE:
+            ROOM_STORE.close()
 
 
 if __name__ == "__main__":
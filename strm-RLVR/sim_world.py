@@ -0,0 +1,195 @@
+"""
+Headless VoxelCraft world
+In-process stand-in for run_voxelcraft.py: a SimRoom holds one room's seed, edits and
+clients on top of a ChunkCache voxel store, and SimWorld is a drop-in VoxelCraftClient
+for one agent in it, so VoxelAgent can run thousands of actions per second without the
+HTTP round trip. Give the room a mirror_url to forward every event to a live server
+and watch the run in the browser.
+"""
+
+import queue
+import threading
+from typing import Dict, Optional
+
+import requests
+
+from spatial_index import ChunkIndex, chunk_coords
+from voxel_terrain import ChunkCache, TerrainGenerator
+from voxelcraft_ai_controller import BlockType, VoxelCraftClient, VoxelPosition
+
+
+class ServerMirror:
+    """Forwards published events to a live server's /publish from a background thread
+
+    The queue is bounded; when the server can't keep up, events are dropped (and counted)
+    rather than slowing the simulation down.
+    """
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8000", max_pending: int = 10000):
+        self.base_url = base_url
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(max_pending)
+        self._session = requests.Session()
+        self._thread = threading.Thread(target=self._run, name="sim-mirror", daemon=True)
+        self._thread.start()
+
+    def publish(self, evt: Dict):
+        try:
+            self._queue.put_nowait(evt)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        """Send what is queued, then stop"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            evt = self._queue.get()
+            if evt is None:
+                return
+            try:
+                self._session.post(f"{self.base_url}/publish", json=evt, timeout=1)
+            except Exception as e:
+                print(f"[mirror] Error forwarding {evt.get('type')}: {e}")
+
+
+class SimRoom:
+    """One room's state, updated exactly like run_voxelcraft.py's /publish handler"""
+
+    def __init__(self, name: str = "alpha", seed: str = "voxelcraft", mirror_url: Optional[str] = None,
+                 capacity: int = 64):
+        self.name = name
+        self.seed = seed
+        self.edits: Dict[str, int] = {}
+        self.clients: Dict[str, Dict] = {}
+        self.index = ChunkIndex()
+        self.world = ChunkCache(TerrainGenerator(seed), capacity)
+        self.events = 0
+        self.mirror = ServerMirror(mirror_url) if mirror_url else None
+        if self.mirror:
+            # A live room keeps the first seed it sees, so mirror into a fresh room
+            self.mirror.publish({"type": "seed", "room": name, "seed": seed})
+
+    def client(self, position: Optional[VoxelPosition] = None) -> "SimWorld":
+        """A new agent connection to this room"""
+        return SimWorld(self, position)
+
+    def publish(self, evt: Dict):
+        t = evt.get("type")
+        cid = evt.get("clientId")
+        if t == "pos" and cid:
+            self.clients[cid] = {
+                "x": evt.get("x"),
+                "y": evt.get("y"),
+                "z": evt.get("z"),
+                "color": evt.get("color"),
+                "name": evt.get("name"),
+                "yaw": evt.get("yaw"),
+                "pitch": evt.get("pitch"),
+            }
+        elif t == "edit":
+            key = evt.get("key")
+            bid = evt.get("id")
+            if isinstance(key, str) and isinstance(bid, int):
+                if bid == 0:
+                    self.edits.pop(key, None)
+                else:
+                    self.edits[key] = bid
+                self.index.set(key, bid)
+                self.world.apply_edits({key: bid})
+        elif t == "leave" and cid:
+            self.clients.pop(cid, None)
+        self.events += 1
+        if self.mirror:
+            self.mirror.publish(evt)
+
+    def snapshot(self) -> Dict:
+        """Same shape as GET /snapshot; the dicts are live, treat them as read-only"""
+        return {"seed": self.seed, "edits": self.edits, "clients": self.clients}
+
+    def close(self):
+        if self.mirror:
+            self.mirror.close()
+
+
+class SimWorld(VoxelCraftClient):
+    """VoxelCraftClient backed by a SimRoom instead of the HTTP server"""
+
+    def __init__(self, room: SimRoom, position: Optional[VoxelPosition] = None):
+        super().__init__(base_url=room.mirror.base_url if room.mirror else "sim://", room=room.name)
+        self.sim = room
+        if position is not None:
+            self.position = position
+        self.world = room.world
+        self._world_seed = room.seed
+
+    def send_position(self, name: str, color: str = "#ff0000"):
+        """Send position update to the room - DISCRETE POSITIONS"""
+        if not self.client_id:
+            self.generate_client_id(name)
+        self.sim.publish({
+            "type": "pos",
+            "clientId": self.client_id,
+            "room": self.room,
+            "name": name,
+            "x": int(round(self.position.x)),
+            "y": int(round(self.position.y)),
+            "z": int(round(self.position.z)),
+            "yaw": round(self.position.yaw, 3),
+            "pitch": round(self.position.pitch, 3),
+            "color": color
+        })
+
+    def place_block(self, block_x: int, block_y: int, block_z: int, block_type: BlockType):
+        self.sim.publish({"type": "edit", "room": self.room, "key": f"{block_x},{block_y},{block_z}",
+                          "id": block_type.value})
+
+    def break_block(self, block_x: int, block_y: int, block_z: int):
+        self.sim.publish({"type": "edit", "room": self.room, "key": f"{block_x},{block_y},{block_z}",
+                          "id": 0})
+
+    def leave(self):
+        if self.client_id:
+            self.sim.publish({"type": "leave", "room": self.room, "clientId": self.client_id})
+
+    def get_snapshot(self) -> Dict:
+        return self.sim.snapshot()
+
+    def world_for(self, seed) -> Optional[ChunkCache]:
+        # The room's store already has every edit applied
+        return self.sim.world
+
+    def query_region(self, cx: Optional[int] = None, cz: Optional[int] = None, r: int = 1) -> Dict[str, int]:
+        if cx is None or cz is None:
+            own_cx, own_cz = chunk_coords(int(round(self.position.x)), int(round(self.position.z)))
+            cx = own_cx if cx is None else cx
+            cz = own_cz if cz is None else cz
+        return self.sim.index.query(cx, cz, r)
+
+
+def benchmark(steps: int = 20000, agents: int = 3, seed: str = "bench"):
+    """Print actions/sec for scripted VoxelAgents stepping in a SimRoom"""
+    import contextlib
+    import os
+    import random
+    import time
+    from voxelcraft_ai_controller import ACTION_TAGS, VoxelAgent
+
+    room = SimRoom("bench", seed)
+    bots = [VoxelAgent(f"Bot{i}", None, room.client(VoxelPosition(i * 4, 60, 0, 0, 0))) for i in range(agents)]
+    choices = list(ACTION_TAGS.values())
+    rng = random.Random(0)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for step in range(steps):
+            action, params = rng.choice(choices)
+            bots[step % agents].execute_action(action, params)
+    elapsed = time.perf_counter() - start
+    print(f"{steps} actions in {elapsed:.2f}s: {steps / elapsed:,.0f} actions/sec "
+          f"({len(room.edits)} edits, {room.world.misses} chunks generated)")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,78 @@
+"""
+Chunk-partitioned spatial index for room edits
+Buckets "x,y,z" edit keys by the same 32x32 column chunks the renderer uses
+(CHUNK in voxelcraft/main.js), so region queries only touch the chunks they cover.
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+
+CHUNK = 32  # must match CHUNK in voxelcraft/main.js
+MAX_REGION_RADIUS = 16
+
+
+def chunk_coords(x: int, z: int) -> Tuple[int, int]:
+    """World block (x, z) -> chunk (cx, cz); floor division matches Math.floor(x / CHUNK)"""
+    return x // CHUNK, z // CHUNK
+
+
+def parse_key(key: str) -> Optional[Tuple[int, int, int]]:
+    """Parse an edit key "x,y,z"; None if it is not three integers
+
+    int() tolerates whitespace around each part; callers that need the canonical
+    spelling compare the key with "%d,%d,%d" % xyz (see room_store).
+    """
+    parts = key.split(",")
+    if len(parts) != 3:
+        return None
+    try:
+        return int(parts[0]), int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+def clamp_radius(r: int) -> int:
+    """Region radius actually served: 0..MAX_REGION_RADIUS"""
+    return max(0, min(MAX_REGION_RADIUS, r))
+
+
+class ChunkIndex:
+    """Edits of one room bucketed by chunk: (cx, cz) -> {key: block id}"""
+
+    def __init__(self, edits: Optional[Dict[str, int]] = None):
+        self.chunks: Dict[Tuple[int, int], Dict[str, int]] = {}
+        if edits:
+            self.update(edits.items())
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.chunks.values())
+
+    def update(self, items: Iterable[Tuple[str, int]]):
+        for key, block_id in items:
+            self.set(key, block_id)
+
+    def set(self, key: str, block_id: int):
+        """Record an edit; block id 0 removes it, mirroring the room's edit dict"""
+        xyz = parse_key(key)
+        if xyz is None:
+            return
+        ck = chunk_coords(xyz[0], xyz[2])
+        if block_id == 0:
+            bucket = self.chunks.get(ck)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self.chunks[ck]
+        else:
+            self.chunks.setdefault(ck, {})[key] = block_id
+
+    def query(self, cx: int, cz: int, r: int = 0) -> Dict[str, int]:
+        """All edits in chunks within Chebyshev distance r of (cx, cz)"""
+        r = clamp_radius(r)
+        out: Dict[str, int] = {}
+        chunks = self.chunks
+        for qx in range(cx - r, cx + r + 1):
+            for qz in range(cz - r, cz + r + 1):
+                bucket = chunks.get((qx, qz))
+                if bucket:
+                    out.update(bucket)
+        return out
@@ -0,0 +1,19 @@
+from build_rewards import RewardEngine, WallTask
+
+
+def _build(task):
+    engine = RewardEngine({"wall": task})
+    engine.apply_edits({"%d,%d,%d" % cell: task.block for cell in task.cells})
+    return engine
+
+
+def test_diagonal_wall_completes():
+    task = WallTask(3, x0=0, z0=0, x1=4, z1=4, y0=0, height=2)
+    assert _build(task).scores()["wall"] == 1.0
+
+
+def test_slanted_walls_complete():
+    for x1, z1 in ((7, 2), (-3, 5), (-6, -1), (0, -4), (5, 0)):
+        task = WallTask(3, x0=1, z0=1, x1=x1, z1=z1, y0=60, height=3)
+        assert (1, 60, 1) in task.cells and (x1, 62, z1) in task.cells
+        assert _build(task).scores()["wall"] == 1.0
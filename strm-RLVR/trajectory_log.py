@@ -0,0 +1,217 @@
+"""
+Columnar trajectory logs for VoxelAgent runs
+One directory per log:
+
+  <dir>/steps.bin    fixed-width STEP_DTYPE records, one per executed action
+  <dir>/strings.bin  UTF-8 heap for raw responses and params JSON (records hold offsets)
+  <dir>/meta.json    agent names and the action list the integer codes refer to
+
+Agents hand steps to TrajectoryWriter, which only enqueues them; a background thread
+batches them to disk. Heap bytes are written before the records pointing at them, so a
+crash at worst loses the tail. TrajectoryReader memory-maps both files, so scanning a
+column is a NumPy operation over the whole run.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+from enum import Enum
+from typing import Dict, List, Optional
+
+import numpy as np
+
+STEPS_NAME = "steps.bin"
+HEAP_NAME = "strings.bin"
+META_NAME = "meta.json"
+
+# prompt_tokens for a step no completion was requested for (replayed from a plan)
+PLAN_STEP_TOKENS = -2
+
+STEP_DTYPE = np.dtype([
+    ("time", "<f8"),            # wall clock when the action ran
+    ("step", "<i4"),            # per-agent step counter
+    ("agent", "<i2"),           # index into meta["agents"]
+    ("action", "<i2"),          # index into meta["actions"], -1 for none
+    ("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("yaw", "<f4"), ("pitch", "<f4"),  # pose after the action
+    ("latency", "<f4"),         # seconds spent deciding (0 for replayed plan steps)
+    ("reward", "<f4"),          # NaN when nothing scored the step
+    ("prompt_tokens", "<i4"),   # from the API's usage report, -1 if unknown, PLAN_STEP_TOKENS if replayed
+    ("obs_hash", "<u8"),        # hash of what the agent was shown
+    ("response_off", "<u8"), ("response_len", "<u4"),
+    ("params_off", "<u8"), ("params_len", "<u4"),
+])
+
+
+def text_hash(text: str) -> int:
+    """Stable 64-bit hash for observation text"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def params_json(params: Optional[Dict]) -> str:
+    return json.dumps({k: (v.name if isinstance(v, Enum) else v) for k, v in (params or {}).items()})
+
+
+class TrajectoryWriter:
+    """Appends steps to a log directory from a background thread
+
+    log_step never blocks: when the bounded queue is full the step is dropped and counted.
+    If a write fails, nothing more is appended (the files may end in a torn record); later
+    steps are counted in `failed` and close() raises the error.
+    """
+
+    def __init__(self, path: str, actions: List[str], max_pending: int = 4096, batch_size: int = 1024):
+        self.path = path
+        self.actions = list(actions)
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.error: Optional[BaseException] = None
+        os.makedirs(path, exist_ok=True)
+        meta = _read_meta(path)
+        if meta and meta["actions"] != self.actions:
+            raise ValueError(f"{path}: logged with a different action list")
+        self.agents: List[str] = meta["agents"] if meta else []
+        self._agent_ids = {name: i for i, name in enumerate(self.agents)}
+        self._steps = open(os.path.join(path, STEPS_NAME), "ab")
+        self._heap = open(os.path.join(path, HEAP_NAME), "ab")
+        # Drop a torn record so appends stay aligned
+        self._steps.truncate(self._steps.tell() - self._steps.tell() % STEP_DTYPE.itemsize)
+        self._heap_off = self._heap.tell()
+        self._write_meta()
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, name="trajectory-writer", daemon=True)
+        self._thread.start()
+
+    def log_step(self, **step):
+        """Queue one step; keys are STEP_DTYPE fields plus agent (name), action (code), response and params"""
+        try:
+            self._queue.put_nowait(step)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Write everything queued and close the files; raises the first write error, if any"""
+        self._queue.put(None)
+        self._thread.join()
+        self._steps.close()
+        self._heap.close()
+        if self.error is not None:
+            raise RuntimeError(f"{self.path}: {self.failed} steps were not written") from self.error
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = batch[-1] is None
+            batch = [step for step in batch if step is not None]
+            if batch and self.error is None:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f"[trajectory] Error writing to {self.path}: {e!r}, not logging any more steps")
+                    self.error = e
+            if batch and self.error is not None:
+                self.failed += len(batch)
+            if done:
+                return
+
+    def _write(self, batch: List[Dict]):
+        records = np.zeros(len(batch), dtype=STEP_DTYPE)
+        for field in ("time", "step", "x", "y", "z", "yaw", "pitch", "latency", "obs_hash"):
+            records[field] = [step.get(field, 0) for step in batch]
+        records["reward"] = [step.get("reward", np.nan) for step in batch]
+        records["prompt_tokens"] = [step.get("prompt_tokens", -1) for step in batch]
+        records["action"] = [step.get("action", -1) for step in batch]
+
+        names = [step.get("agent", "") for step in batch]
+        new_names = [name for name in dict.fromkeys(names) if name not in self._agent_ids]
+        for name in new_names:
+            self._agent_ids[name] = len(self.agents)
+            self.agents.append(name)
+        records["agent"] = [self._agent_ids[name] for name in names]
+
+        # Heap layout per step: response bytes, then params bytes
+        heap = []
+        for field in ("response", "params"):
+            data = [step.get(field, "").encode("utf-8") for step in batch]
+            records[field + "_len"] = [len(d) for d in data]
+            heap.append(data)
+        chunks = [d for pair in zip(*heap) for d in pair]
+        ends = np.cumsum([len(d) for d in chunks], dtype=np.uint64) + np.uint64(self._heap_off)
+        starts = ends - np.array([len(d) for d in chunks], dtype=np.uint64)
+        records["response_off"] = starts[0::2]
+        records["params_off"] = starts[1::2]
+
+        if new_names:
+            self._write_meta()
+        self._heap.write(b"".join(chunks))
+        self._heap.flush()
+        self._heap_off = int(ends[-1]) if len(ends) else self._heap_off
+        self._steps.write(records.tobytes())
+        self._steps.flush()
+        self.written += len(batch)
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, META_NAME + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"agents": self.agents, "actions": self.actions, "dtype": STEP_DTYPE.descr}, f)
+        os.replace(tmp, os.path.join(self.path, META_NAME))
+
+
+def _read_meta(path: str) -> Optional[Dict]:
+    meta_path = os.path.join(path, META_NAME)
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+class TrajectoryReader:
+    """Memory-mapped view of a log directory; `steps` is a STEP_DTYPE record array"""
+
+    def __init__(self, path: str):
+        meta = _read_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f"{path}: no {META_NAME}")
+        self.agents: List[str] = meta["agents"]
+        self.actions: List[str] = meta["actions"]
+        self.steps = _memmap(os.path.join(path, STEPS_NAME), STEP_DTYPE)
+        self.heap = _memmap(os.path.join(path, HEAP_NAME), np.dtype(np.uint8))
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def _text(self, off, length) -> str:
+        return self.heap[int(off):int(off) + int(length)].tobytes().decode("utf-8")
+
+    def response(self, i: int) -> str:
+        return self._text(self.steps["response_off"][i], self.steps["response_len"][i])
+
+    def params(self, i: int) -> Dict:
+        return json.loads(self._text(self.steps["params_off"][i], self.steps["params_len"][i]) or "{}")
+
+    def agent(self, i: int) -> str:
+        return self.agents[self.steps["agent"][i]]
+
+    def action(self, i: int) -> Optional[str]:
+        code = int(self.steps["action"][i])
+        return self.actions[code] if code >= 0 else None
+
+    def for_agent(self, name: str) -> np.ndarray:
+        """Records of one agent, in order"""
+        return self.steps[self.steps["agent"] == self.agents.index(name)]
+
+
+def _memmap(path: str, dtype: np.dtype) -> np.ndarray:
+    size = os.path.getsize(path) if os.path.isfile(path) else 0
+    count = size // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
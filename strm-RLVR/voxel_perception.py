@@ -0,0 +1,96 @@
+"""
+Local voxel perception for VoxelCraft agents
+Builds a fixed-size egocentric observation from a ChunkCache: a (2r+1)^3 block grid
+around the agent, turned so "forward" is the top row, plus a raycast along yaw/pitch.
+Everything is array slicing on cached chunks, so one observation costs well under 1 ms.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+from voxel_terrain import AIR, ChunkCache, block_name
+
+# One character per block id for text maps ('?' for unknown ids)
+BLOCK_CHARS = ".gd#:~w%*"
+_CHAR_TABLE = np.array(list(BLOCK_CHARS) + ["?"] * (256 - len(BLOCK_CHARS)))
+LEGEND = "Legend: . air  g grass  d dirt  # stone  : sand  ~ water  w wood  % leaves  * snow  @ you"
+
+
+@dataclass
+class Observation:
+    """Egocentric view of one agent
+
+    grid is indexed [up, ahead, right]: grid[r, r, r] is the agent's own block,
+    row 0 is farthest ahead and column 0 is farthest left. Facing is the agent's
+    yaw snapped to the nearest 90 degrees.
+    """
+    grid: np.ndarray
+    facing: int  # 0..3, quarter turns of yaw
+    ray_block: int  # first non-air block along the view ray, AIR if none in range
+    ray_distance: Optional[float]
+    ray_hit: Optional[Tuple[int, int, int]]
+
+    def to_text(self, layers: Tuple[int, ...] = (-1, 0, 1)) -> str:
+        """Compact top-down map of a few horizontal layers relative to the agent"""
+        r = self.grid.shape[0] // 2
+        slices = []
+        for dy in layers:
+            chars = _CHAR_TABLE[self.grid[r + dy]]
+            if dy == 0:
+                chars = chars.copy()
+                chars[r, r] = "@"
+            slices.append(["".join(row) for row in chars])
+
+        width = self.grid.shape[2]
+        lines = ["Local map (forward is up):",
+                 "  ".join(f"y{dy:+d}".ljust(width) for dy in layers)]
+        lines += ["  ".join(rows) for rows in zip(*slices)]
+        lines.append(LEGEND)
+        if self.ray_distance is None:
+            lines.append("Looking at: nothing in range")
+        else:
+            x, y, z = self.ray_hit
+            lines.append(f"Looking at: {block_name(self.ray_block)} {self.ray_distance:.1f} blocks away at ({x}, {y}, {z})")
+        return "\n".join(lines)
+
+
+class ObservationBuilder:
+    """Builds Observations for agent positions (anything with x, y, z, yaw, pitch)"""
+
+    def __init__(self, world: ChunkCache, radius: int = 4, ray_length: float = 16.0,
+                 ray_step: float = 0.125):
+        self.world = world
+        self.radius = radius
+        self._ray_t = np.arange(1, int(ray_length / ray_step) + 1) * ray_step
+
+    def build(self, pos) -> Observation:
+        r = self.radius
+        size = 2 * r + 1
+        x, y, z = int(round(pos.x)), int(round(pos.y)), int(round(pos.z))
+        grid = self.world.region(x - r, y - r, z - r, size, size, size)  # [y, z, x]
+
+        # Forward is (-sin(yaw), -cos(yaw)), so yaw 0 looks toward -z: row 0 is already
+        # "ahead". Each quarter turn of yaw is a quarter turn of the z/x plane.
+        facing = int(round(pos.yaw / (math.pi / 2))) % 4
+        grid = np.ascontiguousarray(np.rot90(grid, -facing, axes=(1, 2)))
+
+        ray_block, ray_distance, ray_hit = self.raycast(pos)
+        return Observation(grid, facing, ray_block, ray_distance, ray_hit)
+
+    def raycast(self, pos):
+        """First non-air block along the view direction: (block id, distance, (x, y, z))"""
+        cp = math.cos(pos.pitch)
+        # Negative pitch looks up (LOOK_UP subtracts from pitch)
+        direction = np.array([-math.sin(pos.yaw) * cp, -math.sin(pos.pitch), -math.cos(pos.yaw) * cp])
+        origin = np.array([round(pos.x) + 0.5, round(pos.y) + 0.5, round(pos.z) + 0.5])
+        cells = np.floor(origin + self._ray_t[:, None] * direction).astype(np.int64)
+        blocks = self.world.blocks_at(cells[:, 0], cells[:, 1], cells[:, 2])
+        own = (cells == np.floor(origin).astype(np.int64)).all(axis=1)
+        hits = np.flatnonzero((blocks != AIR) & ~own)
+        if len(hits) == 0:
+            return AIR, None, None
+        i = hits[0]
+        return int(blocks[i]), float(self._ray_t[i]), tuple(int(c) for c in cells[i])
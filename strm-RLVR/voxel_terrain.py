@@ -0,0 +1,362 @@
+"""
+VoxelCraft terrain generator (NumPy port of voxelcraft/main.js)
+Reproduces hashString32, hash3i, noise2, heightAt, biomeAt, placeTree and genChunk
+bit-for-bit, vectorized over whole chunks, so agents and the server can answer
+"what block is at (x, y, z)" without a browser.
+
+Chunk arrays use the same layout as the JS Uint8Array: shape (WORLD_HEIGHT, CHUNK, CHUNK)
+indexed [y, z, x], so chunk.tobytes() equals the bytes genChunk produces.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from spatial_index import parse_key
+
+# World constants (must match voxelcraft/main.js)
+CHUNK = 32
+WORLD_HEIGHT = 256
+WATER_LEVEL = 40
+
+# Block ids (same values as BlockType in voxelcraft_ai_controller.py)
+AIR, GRASS, DIRT, STONE, SAND, WATER, WOOD, LEAVES, SNOW = range(9)
+BLOCK_NAMES = ("air", "grass", "dirt", "stone", "sand", "water", "wood", "leaves", "snow")
+
+# Biome codes, in the order of BIOME in main.js
+DESERT, PLAINS, FOREST, TAIGA, TUNDRA = range(5)
+BIOME_NAMES = ("desert", "plains", "forest", "taiga", "tundra")
+
+_M32 = 0xFFFFFFFF
+
+
+def block_name(block_id: int) -> str:
+    return BLOCK_NAMES[block_id] if 0 <= block_id < len(BLOCK_NAMES) else f"block {block_id}"
+
+
+def hash_string32(s: str) -> int:
+    """FNV-1a over UTF-16 code units, like hashString32 (JS charCodeAt)"""
+    h = 2166136261
+    units = s.encode("utf-16-le")
+    for i in range(0, len(units), 2):
+        h ^= units[i] | (units[i + 1] << 8)
+        h = (h * 16777619) & _M32
+    return h
+
+
+def hash3i(x, y, z, seed: int) -> np.ndarray:
+    """Deterministic per-position hash in [0, 1], matching hash3i (Math.imul wraps to 32 bits)"""
+    x = np.asarray(x, dtype=np.int64) & _M32
+    y = np.asarray(y, dtype=np.int64) & _M32
+    z = np.asarray(z, dtype=np.int64) & _M32
+    h = ((x * 374761393 + y * 668265263) & _M32) ^ ((z * 2147483647) & _M32) ^ seed
+    h = ((h ^ (h >> 13)) * 1274126177) & _M32
+    return (h ^ (h >> 16)) / 4294967295.0
+
+
+def noise2(x, z, seed: int) -> np.ndarray:
+    """Bilinear value noise over hash3i lattice points"""
+    x = np.asarray(x, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    x0, z0 = np.floor(x), np.floor(z)
+    sx, sz = x - x0, z - z0
+    ix, iz = x0.astype(np.int64), z0.astype(np.int64)
+    n00 = hash3i(ix, 0, iz, seed)
+    n10 = hash3i(ix + 1, 0, iz, seed)
+    n01 = hash3i(ix, 0, iz + 1, seed)
+    n11 = hash3i(ix + 1, 0, iz + 1, seed)
+    ix0 = n00 + (n10 - n00) * sx
+    ix1 = n01 + (n11 - n01) * sx
+    return ix0 + (ix1 - ix0) * sz
+
+
+def height_at(x, z, seed: int) -> np.ndarray:
+    """Terrain surface height per (x, z) column, as heightAt"""
+    x = np.asarray(x, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    base = noise2(x * 0.001875, z * 0.001875, seed)
+    ridge = 1 - np.abs(2 * noise2(x * 0.00375 + 100, z * 0.00375 - 100, seed) - 1)
+    h = 10 + np.power(0.5 * base + 0.5 * ridge, 1.55) * 110
+    h = h + (noise2(x * 0.012, z * 0.012, seed) - 0.5) * 10
+    h = h + ((1 - np.abs(2 * noise2(x * 0.022 + 200, z * 0.022 + 200, seed) - 1)) * 5 - 2.5)
+    return np.clip(np.floor(h), 0, WORLD_HEIGHT - 2).astype(np.int64)
+
+
+def temperature_at(x, z, seed: int, height=None) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    if height is None:
+        height = height_at(x, z, seed)
+    base = noise2(x * 0.008 + seed * 0.001, z * 0.008 - seed * 0.001, seed)
+    mid = noise2(x * 0.03 + 100.123, z * 0.03 - 55.321, seed)
+    alt = height / WORLD_HEIGHT
+    t = 0.7 * base + 0.3 * mid
+    t = t - alt * 0.6
+    return np.clip(t, 0, 1)
+
+
+def moisture_at(x, z, seed: int, height=None) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    if height is None:
+        height = height_at(x, z, seed)
+    base = noise2(x * 0.005 - seed * 0.001, z * 0.005 + seed * 0.001, seed)
+    mid = noise2(x * 0.02 + 333.77, z * 0.02 - 987.11, seed)
+    m = 0.6 * base + 0.4 * mid
+    m = np.where(height < WATER_LEVEL + 2, np.clip(m + 0.25, 0, 1), m)
+    return np.clip(m, 0, 1)
+
+
+def biome_at(x, z, seed: int, height=None) -> np.ndarray:
+    """Biome code per column (DESERT, PLAINS, FOREST, TAIGA or TUNDRA)"""
+    if height is None:
+        height = height_at(x, z, seed)
+    t = temperature_at(x, z, seed, height)
+    m = moisture_at(x, z, seed, height)
+    return np.select(
+        [(t > 0.7) & (m < 0.35), (t < 0.25) & (m < 0.35), (t < 0.35) & (m >= 0.35), m > 0.6],
+        [DESERT, TUNDRA, TAIGA, FOREST],
+        default=PLAINS,
+    )
+
+
+def _leaf_offsets(radius: int):
+    """(dy, dz, dx) offsets inside the sphere placeTree fills with leaves"""
+    r = np.arange(-radius, radius + 1)
+    dy, dz, dx = np.meshgrid(r, r, r, indexing="ij")
+    inside = dx * dx + dy * dy + dz * dz <= radius * radius
+    return dy[inside], dz[inside], dx[inside]
+
+
+_LEAF_OFFSETS = {radius: _leaf_offsets(radius) for radius in range(3, 6)}
+
+
+class TerrainGenerator:
+    """Seeded terrain; seed may be the world seed string (as typed in the UI) or its 32-bit hash"""
+
+    def __init__(self, seed: Union[str, int]):
+        self.seed_str = seed if isinstance(seed, str) else None
+        self.seed = hash_string32(seed) if isinstance(seed, str) else int(seed) & _M32
+
+    def height_at(self, x, z):
+        return height_at(x, z, self.seed)
+
+    def biome_at(self, x, z):
+        return biome_at(x, z, self.seed)
+
+    def gen_chunk(self, cx: int, cz: int) -> np.ndarray:
+        """Terrain and trees of one chunk (without edits), as genChunk"""
+        seed = self.seed
+        lz, lx = np.mgrid[0:CHUNK, 0:CHUNK]
+        wx = cx * CHUNK + lx
+        wz = cz * CHUNK + lz
+        hh = height_at(wx, wz, seed)                 # (z, x)
+        desert = biome_at(wx, wz, seed, hh) == DESERT
+
+        y = np.arange(WORLD_HEIGHT).reshape(-1, 1, 1)
+        hh3 = hh[None]
+        beach = hh3 < WATER_LEVEL + 3
+        surface = np.where(hh3 >= 90, SNOW, np.where(desert, SAND, GRASS))
+        voxels = np.select(
+            [(y <= hh3) & beach,
+             y == hh3,
+             (y < hh3) & (y > hh3 - 3),
+             y < hh3,
+             (y < WATER_LEVEL) & (y > hh3)],
+            [np.where(y > hh3 - 2, SAND, STONE),
+             surface,
+             np.where(desert, SAND, DIRT),
+             STONE,
+             WATER],
+            default=AIR,
+        ).astype(np.uint8)
+
+        # Trees: candidates on the inner 24x24 columns, placed in the same x-major order as JS
+        inner = slice(4, CHUNK - 4)
+        rng = hash3i(wx[inner, inner], wz[inner, inner], 555, seed)
+        ground = voxels[hh[inner, inner], lz[inner, inner], lx[inner, inner]]
+        ok = (rng < 0.015) & (hh[inner, inner] > WATER_LEVEL) & ((ground == GRASS) | (ground == SNOW))
+        tz, tx = np.nonzero(ok)
+        for z, x in sorted(zip((tz + 4).tolist(), (tx + 4).tolist()), key=lambda p: (p[1], p[0])):
+            self._place_tree(voxels, cx, cz, x, z, int(hh[z, x]) + 1)
+        return voxels
+
+    def _place_tree(self, voxels: np.ndarray, cx: int, cz: int, lx: int, lz: int, ground_y: int):
+        h = float(hash3i(cx * CHUNK + lx, ground_y, cz * CHUNK + lz, self.seed))
+        height = 15 + int(np.floor(h * 15))
+        leaf_r = 3 + int(np.floor(h * 2.5))
+
+        voxels[ground_y:min(ground_y + height, WORLD_HEIGHT), lz, lx] = WOOD
+
+        dy, dz, dx = _LEAF_OFFSETS[leaf_r]
+        vy, vz, vx = ground_y + height - 1 + dy, lz + dz, lx + dx
+        inb = (vx >= 0) & (vx < CHUNK) & (vz >= 0) & (vz < CHUNK) & (vy >= 0) & (vy < WORLD_HEIGHT)
+        vy, vz, vx = vy[inb], vz[inb], vx[inb]
+        air = voxels[vy, vz, vx] == AIR
+        voxels[vy[air], vz[air], vx[air]] = LEAVES
+
+
+class ChunkCache:
+    """LRU of generated chunks with room edits ("x,y,z" -> block id) layered on top"""
+
+    def __init__(self, terrain: TerrainGenerator, capacity: int = 64):
+        self.terrain = terrain
+        self.capacity = capacity
+        self._chunks: "OrderedDict[Tuple[int, int], np.ndarray]" = OrderedDict()
+        self._edits: Dict[Tuple[int, int], Dict[Tuple[int, int, int], int]] = {}
+        self._synced: Dict[str, int] = {}  # the edit set of the last sync_edits()
+        self._local = set()  # (x, y, z) set since then, which the next sync re-checks
+        self.hits = 0
+        self.misses = 0
+
+    def chunk(self, cx: int, cz: int) -> np.ndarray:
+        """Voxel array of a chunk, edits applied; treat as read-only"""
+        key = (cx, cz)
+        voxels = self._chunks.get(key)
+        if voxels is not None:
+            self._chunks.move_to_end(key)
+            self.hits += 1
+            return voxels
+        self.misses += 1
+        voxels = self.terrain.gen_chunk(cx, cz)
+        for (y, lz, lx), block_id in self._edits.get(key, {}).items():
+            voxels[y, lz, lx] = block_id
+        self._chunks[key] = voxels
+        if len(self._chunks) > self.capacity:
+            self._chunks.popitem(last=False)
+        return voxels
+
+    def block_at(self, x: int, y: int, z: int) -> int:
+        if y < 0 or y >= WORLD_HEIGHT:
+            return AIR
+        return int(self.chunk(x // CHUNK, z // CHUNK)[y, z % CHUNK, x % CHUNK])
+
+    def region(self, x0: int, y0: int, z0: int, sx: int, sy: int, sz: int) -> np.ndarray:
+        """Copy of the box starting at (x0, y0, z0), shape (sy, sz, sx) indexed [y, z, x]"""
+        out = np.zeros((sy, sz, sx), dtype=np.uint8)
+        ylo, yhi = max(y0, 0), min(y0 + sy, WORLD_HEIGHT)
+        if ylo >= yhi:
+            return out
+        for cx in range(x0 // CHUNK, (x0 + sx - 1) // CHUNK + 1):
+            xa, xb = max(x0, cx * CHUNK), min(x0 + sx, (cx + 1) * CHUNK)
+            for cz in range(z0 // CHUNK, (z0 + sz - 1) // CHUNK + 1):
+                za, zb = max(z0, cz * CHUNK), min(z0 + sz, (cz + 1) * CHUNK)
+                out[ylo - y0:yhi - y0, za - z0:zb - z0, xa - x0:xb - x0] = \
+                    self.chunk(cx, cz)[ylo:yhi, za - cz * CHUNK:zb - cz * CHUNK, xa - cx * CHUNK:xb - cx * CHUNK]
+        return out
+
+    def blocks_at(self, xs, ys, zs) -> np.ndarray:
+        """Vectorized block_at over integer coordinate arrays"""
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        zs = np.asarray(zs, dtype=np.int64)
+        out = np.zeros(xs.shape, dtype=np.uint8)
+        valid = (ys >= 0) & (ys < WORLD_HEIGHT)
+        cxs, czs = xs // CHUNK, zs // CHUNK
+        for cx, cz in set(zip(cxs[valid].tolist(), czs[valid].tolist())):
+            m = valid & (cxs == cx) & (czs == cz)
+            out[m] = self.chunk(cx, cz)[ys[m], zs[m] % CHUNK, xs[m] % CHUNK]
+        return out
+
+    def set_block(self, x: int, y: int, z: int, block_id: int):
+        """Apply one edit; cached chunks are patched in place"""
+        if y < 0 or y >= WORLD_HEIGHT:
+            return
+        key = (x // CHUNK, z // CHUNK)
+        local = (y, z % CHUNK, x % CHUNK)
+        self._edits.setdefault(key, {})[local] = block_id
+        self._local.add((x, y, z))
+        voxels = self._chunks.get(key)
+        if voxels is not None:
+            voxels[local] = block_id
+
+    def apply_edits(self, edits: Dict[str, int]):
+        """Apply edits in the server's snapshot / region format"""
+        for key, block_id in edits.items():
+            xyz = parse_key(key)
+            if xyz is not None:
+                self.set_block(*xyz, block_id)
+
+    def sync_edits(self, edits: Dict[str, int]):
+        """Make the cache match a room's complete edit set (a /snapshot "edits" dict)
+
+        The server forgets a broken block instead of storing air, so apply_edits alone
+        never sees removals. Here keys that changed or vanished since the last sync, and
+        blocks set locally since then, are re-read from edits; a voxel whose edit is gone
+        goes back to base terrain by regenerating its chunk.
+        """
+        touched = {key for key, _ in edits.items() ^ self._synced.items()}
+        touched.update("%d,%d,%d" % xyz for xyz in self._local)
+        for key in touched:
+            xyz = parse_key(key)
+            if xyz is None or not 0 <= xyz[1] < WORLD_HEIGHT:
+                continue
+            x, y, z = xyz
+            ck = (x // CHUNK, z // CHUNK)
+            local = (y, z % CHUNK, x % CHUNK)
+            block_id = edits.get(key, 0)
+            if block_id:
+                self._edits.setdefault(ck, {})[local] = block_id
+                voxels = self._chunks.get(ck)
+                if voxels is not None:
+                    voxels[local] = block_id
+            else:
+                chunk_edits = self._edits.get(ck)
+                if chunk_edits is not None:
+                    chunk_edits.pop(local, None)
+                self._chunks.pop(ck, None)
+        self._synced = dict(edits)
+        self._local.clear()
+
+    def surface_y(self, x: int, z: int) -> int:
+        """Highest non-air block in the column, -1 if the column is empty"""
+        column = self.chunk(x // CHUNK, z // CHUNK)[:, z % CHUNK, x % CHUNK]
+        solid = np.nonzero(column)[0]
+        return int(solid[-1]) if len(solid) else -1
+
+
+def benchmark(seconds: float = 3.0, seed: str = "bench"):
+    """Print chunks/sec for uncached generation"""
+    import time
+    gen = TerrainGenerator(seed)
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        gen.gen_chunk(n % 16, n // 16)
+        n += 1
+    elapsed = time.perf_counter() - start
+    print(f"Generated {n} chunks in {elapsed:.2f}s: {n / elapsed:.1f} chunks/sec")
+
+
+def check_parity(path: Optional[str] = None):
+    """Compare against values exported from main.js by voxelcraft/export_terrain_fixture.js"""
+    import base64
+    import json
+    import os
+    import zlib
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voxelcraft", "terrain_fixture.json")
+    with open(path) as f:
+        fixture = json.load(f)
+    xs, zs = np.array(fixture["columns"], dtype=np.int64).T
+    for seed, expected in fixture["seeds"].items():
+        gen = TerrainGenerator(seed)
+        assert gen.seed == expected["hash"], f"{seed}: hashString32 {gen.seed} != {expected['hash']}"
+        heights = gen.height_at(xs, zs)
+        assert heights.tolist() == expected["heights"], f"{seed}: heightAt mismatch"
+        biomes = [BIOME_NAMES[b] for b in gen.biome_at(xs, zs)]
+        assert biomes == expected["biomes"], f"{seed}: biomeAt mismatch"
+        for chunk in expected["chunks"]:
+            voxels = gen.gen_chunk(chunk["cx"], chunk["cz"]).tobytes()
+            assert voxels == zlib.decompress(base64.b64decode(chunk["voxels"])), \
+                f"{seed}: genChunk({chunk['cx']}, {chunk['cz']}) mismatch"
+        print(f"{seed}: {len(xs)} columns and {len(expected['chunks'])} chunks match main.js")
+
+
+if __name__ == "__main__":
+    import sys
+    if "--check-parity" in sys.argv:
+        check_parity()
+    else:
+        benchmark()
@@ -0,0 +1,67 @@
+// Export terrain reference values from main.js for the Python port (voxel_terrain.py)
+//
+//   node voxelcraft/export_terrain_fixture.js > voxelcraft/terrain_fixture.json
+//   python voxel_terrain.py --check-parity
+//
+// main.js only runs in a browser, so the terrain functions and constants are cut out
+// of its source and evaluated on their own; edits are left empty.
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+const zlib = require('zlib');
+
+const src = fs.readFileSync(path.join(__dirname, 'main.js'), 'utf8');
+
+function functionSource(name) {
+  const start = src.indexOf(`function ${name}(`);
+  if (start < 0) throw new Error(`main.js has no function ${name}`);
+  let depth = 0;
+  for (let i = src.indexOf('{', start); i < src.length; i++) {
+    if (src[i] === '{') depth++;
+    else if (src[i] === '}' && --depth === 0) return src.slice(start, i + 1);
+  }
+  throw new Error(`unbalanced braces in ${name}`);
+}
+
+function constSource(name) {
+  const m = src.match(new RegExp(`^const ${name} = [^\\n]*`, 'm'));
+  if (!m) throw new Error(`main.js has no const ${name}`);
+  return m[0];
+}
+
+const code = [
+  ...['CHUNK', 'WORLD_HEIGHT', 'WATER_LEVEL', 'BIOME', 'AIR'].map(constSource),
+  'let worldSeed = 0;',
+  'const edits = new Map();',
+  ...['hashString32', 'hash3i', 'noise2', 'heightAt', 'lerp', 'clamp', 'temperatureAt', 'moistureAt',
+      'biomeAt', 'placeTree', 'genChunk'].map(functionSource),
+  'this.api = { hashString32, heightAt, biomeAt, genChunk, CHUNK, setSeed: s => { worldSeed = hashString32(s); } };',
+].join('\n');
+const ctx = {};
+vm.runInNewContext(code, ctx);
+const T = ctx.api;
+
+// Columns near the origin plus far-out ones, where Math.imul wrap-around matters
+const columns = [];
+for (let i = 0; i < 48; i++) columns.push([(i * 7919) % 4001 - 2000, (i * 104729) % 6007 - 3000]);
+columns.push([1000000, -1000000], [-16777216, 16777215], [0, 0], [-1, -1]);
+
+const seeds = ['voxelcraft', 'alpha', 'bench'];
+const fixture = { columns, seeds: {} };
+for (const seed of seeds) {
+  T.setSeed(seed);
+  const chunks = [[0, 0], [-1, 2]];
+  // plus the first chunk with a tree, so placeTree is covered too
+  for (let cx = 0; chunks.length < 3 && cx < 64; cx++) {
+    if (T.genChunk(cx, 5).includes(6)) chunks.push([cx, 5]);
+  }
+  fixture.seeds[seed] = {
+    hash: T.hashString32(seed),
+    heights: columns.map(([x, z]) => T.heightAt(x, z)),
+    biomes: columns.map(([x, z]) => T.biomeAt(x, z)),
+    chunks: chunks.map(([cx, cz]) => ({
+      cx, cz, voxels: zlib.deflateSync(Buffer.from(T.genChunk(cx, cz))).toString('base64'),
+    })),
+  };
+}
+process.stdout.write(JSON.stringify(fixture) + '\n');
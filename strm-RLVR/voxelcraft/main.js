@@ -157,36 +157,82 @@ async function sendPosition() {
   }
 }
 
+// Compact pose frames (see pose_protocol.py): 'P' + base64 of 14-byte records
+// id u16, x i32, y i16, z i32 (all in 1/POSE_SCALE blocks), yaw u8, pitch i8, little-endian
+const POSE_FRAME_BYTES = 14;
+const POSE_SCALE = 16;
+// Pose id -> {clientId, name, color}, from the server's join events
+const poseIds = new Map();
+
+function updateOtherPlayer(id, data) {
+  const isNewPlayer = !otherPlayers.has(id);
+  const player = otherPlayers.get(id) || {};
+  player.x = data.x;
+  player.y = data.y;
+  player.z = data.z;
+  player.yaw = data.yaw || 0;
+  player.pitch = data.pitch || 0;
+  player.name = data.name || 'Unknown';
+  player.color = data.color || [1, 1, 1];
+  player.lastUpdate = Date.now();
+  otherPlayers.set(id, player);
+
+  // Update UI when new player joins
+  if (isNewPlayer) {
+    updatePlayersUI();
+  }
+}
+
+function applyPoseFrames(text) {
+  const bin = atob(text.slice(1));
+  const bytes = new Uint8Array(bin.length);
+  for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+  const view = new DataView(bytes.buffer);
+  for (let off = 0; off + POSE_FRAME_BYTES <= bytes.length; off += POSE_FRAME_BYTES) {
+    const who = poseIds.get(view.getUint16(off, true));
+    if (!who) continue; // our own pose, or a join we have not seen
+    updateOtherPlayer(who.clientId, {
+      x: view.getInt32(off + 2, true) / POSE_SCALE,
+      y: view.getInt16(off + 6, true) / POSE_SCALE,
+      z: view.getInt32(off + 8, true) / POSE_SCALE,
+      yaw: view.getUint8(off + 12) * (2 * Math.PI / 256),
+      pitch: view.getInt8(off + 13) * (Math.PI / 2 / 127),
+      name: who.name,
+      color: who.color
+    });
+  }
+}
+
 // Subscribe to server events for other players
 let sseConnection = null;
 function connectMultiplayer() {
   try {
-    sseConnection = new EventSource(`./events?room=${encodeURIComponent(multiplayerRoom)}`);
+    sseConnection = new EventSource(`./events?room=${encodeURIComponent(multiplayerRoom)}&poses=compact`);
 
     sseConnection.onmessage = (event) => {
       try {
+        if (event.data.charCodeAt(0) === 80) { // 'P'
+          applyPoseFrames(event.data);
+          return;
+        }
         const data = JSON.parse(event.data);
 
         if (data.type === 'pos' && data.clientId && data.clientId !== clientId) {
           // Update other player's position
-          const isNewPlayer = !otherPlayers.has(data.clientId);
-          const player = otherPlayers.get(data.clientId) || {};
-          player.x = data.x;
-          player.y = data.y;
-          player.z = data.z;
-          player.yaw = data.yaw || 0;
-          player.pitch = data.pitch || 0;
-          player.name = data.name || 'Unknown';
-          player.color = data.color || [1, 1, 1];
-          player.lastUpdate = Date.now();
-          otherPlayers.set(data.clientId, player);
-
-          // Update UI when new player joins
-          if (isNewPlayer) {
+          updateOtherPlayer(data.clientId, data);
+        } else if (data.type === 'join' && data.clientId && data.clientId !== clientId) {
+          poseIds.set(data.id, { clientId: data.clientId, name: data.name, color: data.color });
+          const player = otherPlayers.get(data.clientId);
+          if (player) {
+            player.name = data.name || 'Unknown';
+            player.color = data.color || [1, 1, 1];
             updatePlayersUI();
           }
         } else if (data.type === 'leave' && data.clientId) {
           // Remove player who left
+          for (const [id, who] of poseIds.entries()) {
+            if (who.clientId === data.clientId) poseIds.delete(id);
+          }
           const player = otherPlayers.get(data.clientId);
           if (player && player.vbo) {
             gl.deleteBuffer(player.vbo);
@@ -6,15 +6,25 @@ Connects AI agents to VoxelCraft world with token-level interleaving
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
+import math
 import requests
 import json
 import time
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional
 from enum import Enum
 from dataclasses import dataclass
 import threading
 import random
+import re
+from collections import deque
 from multi_agent_stream import StreamMode
+from agent_history import ActionRecord, MessageRecord, RingBuffer
+from build_rewards import RewardEngine, TowerTask
+from completion_cache import CompletionCache
+from spatial_index import chunk_coords
+from trajectory_log import PLAN_STEP_TOKENS, TrajectoryWriter, params_json, text_hash
+from voxel_terrain import ChunkCache, TerrainGenerator, block_name
+from voxel_perception import Observation, ObservationBuilder
 
 load_dotenv()
 
@@ -34,6 +44,11 @@ class VoxelAction(Enum):
     PLACE_BLOCK = "place_block"
     BREAK_BLOCK = "break_block"
     WAIT = "wait"
+    CUSTOM = "custom"  # registered with register_action(); params["action"] names it
+
+
+# Stable integer codes, e.g. for trajectory logs
+ACTION_CODES = {action: i for i, action in enumerate(VoxelAction)}
 
 
 class BlockType(Enum):
@@ -48,6 +63,143 @@ class BlockType(Enum):
     SNOW = 8
 
 
+# Action tags the model can emit, in priority order: a single-action reply that
+# mentions several runs the first one listed here. Extend with register_action().
+ACTION_TAGS: Dict[str, Tuple[VoxelAction, Dict]] = {
+    "move_forward": (VoxelAction.MOVE_FORWARD, {}),
+    "move_backward": (VoxelAction.MOVE_BACKWARD, {}),
+    "move_left": (VoxelAction.MOVE_LEFT, {}),
+    "move_right": (VoxelAction.MOVE_RIGHT, {}),
+    "move_up": (VoxelAction.MOVE_UP, {}),
+    "move_down": (VoxelAction.MOVE_DOWN, {}),
+    "turn_left": (VoxelAction.TURN_LEFT, {}),
+    "turn_right": (VoxelAction.TURN_RIGHT, {}),
+    "look_up": (VoxelAction.LOOK_UP, {}),
+    "look_down": (VoxelAction.LOOK_DOWN, {}),
+    "place_grass": (VoxelAction.PLACE_BLOCK, {"block_type": BlockType.GRASS}),
+    "place_stone": (VoxelAction.PLACE_BLOCK, {"block_type": BlockType.STONE}),
+    "place_wood": (VoxelAction.PLACE_BLOCK, {"block_type": BlockType.WOOD}),
+    "break_block": (VoxelAction.BREAK_BLOCK, {}),
+    "wait": (VoxelAction.WAIT, {}),
+}
+_TAG_RANK = {tag: i for i, tag in enumerate(ACTION_TAGS)}
+# Prompt lines for tags added with register_action()
+EXTRA_ACTION_HELP: Dict[str, str] = {}
+# Handlers for CUSTOM actions, by tag
+CUSTOM_HANDLERS: Dict[str, Callable] = {}
+
+# Mode switches are case-sensitive; broadcast wins when a reply has both
+MODE_TAGS = {"broadcast": StreamMode.BROADCAST, "internal": StreamMode.INTERNAL}
+ANY_TAG = re.compile(r"<([A-Za-z_]+)>")
+VALID_TAG = re.compile(r"[a-z_]+")
+# An action tag, or an "xN" repeat marker for the tags before it on the same line
+PLAN_TOKEN = re.compile(r"<([a-z_]+)>|(?<![a-z0-9])[x×]\s*(\d+)\b")
+MAX_PLAN_LENGTH = 32
+MAX_PLAN_REPEAT = 10
+
+# Discrete steps (dx, dy, dz) for each of the 8 yaw states TURN_LEFT / TURN_RIGHT reach
+YAW_STEP = math.pi / 4
+ROTATIONS = {
+    VoxelAction.TURN_LEFT: (YAW_STEP, 0.0),
+    VoxelAction.TURN_RIGHT: (-YAW_STEP, 0.0),
+    VoxelAction.LOOK_UP: (0.0, -0.3),
+    VoxelAction.LOOK_DOWN: (0.0, 0.3),
+}
+
+
+def _move_steps(yaw: float) -> Dict[VoxelAction, Tuple[int, int, int]]:
+    s, c = math.sin(yaw), math.cos(yaw)
+    return {
+        VoxelAction.MOVE_FORWARD: (round(-s), 0, round(-c)),
+        VoxelAction.MOVE_BACKWARD: (round(s), 0, round(c)),
+        VoxelAction.MOVE_LEFT: (round(-c), 0, round(s)),
+        VoxelAction.MOVE_RIGHT: (round(c), 0, round(-s)),
+        VoxelAction.MOVE_UP: (0, 1, 0),
+        VoxelAction.MOVE_DOWN: (0, -1, 0),
+    }
+
+
+MOVE_STEPS = [_move_steps(k * YAW_STEP) for k in range(8)]
+
+
+def move_step(action: VoxelAction, yaw: float) -> Tuple[int, int, int]:
+    """One-block step for a MOVE_* action; table lookup unless yaw is off the 45° grid"""
+    k = round(yaw / YAW_STEP)
+    if abs(yaw - k * YAW_STEP) < 1e-6:
+        return MOVE_STEPS[k % 8][action]
+    return _move_steps(yaw)[action]
+
+
+REACH = 3  # PLACE_BLOCK / BREAK_BLOCK edit the voxel this many blocks ahead
+
+
+def _target_offset(yaw: float) -> Tuple[float, float]:
+    return -math.sin(yaw) * REACH, -math.cos(yaw) * REACH
+
+
+# [yaw state] -> horizontal offset of the edit target before truncation
+TARGET_OFFSETS = [_target_offset(k * YAW_STEP) for k in range(8)]
+
+
+def edit_target(x: float, y: float, z: float, yaw: float) -> Tuple[int, int, int]:
+    """Voxel a PLACE_BLOCK / BREAK_BLOCK from (x, y, z) facing yaw edits; table lookup on the 45° grid"""
+    k = round(yaw / YAW_STEP)
+    if abs(yaw - k * YAW_STEP) < 1e-6:
+        dx, dz = TARGET_OFFSETS[k % 8]
+    else:
+        dx, dz = _target_offset(yaw)
+    return int(x + dx), int(y), int(z + dz)
+
+
+def register_action(tag: str, action: VoxelAction = VoxelAction.CUSTOM, params: Optional[Dict] = None,
+                    handler: Optional[Callable] = None, description: Optional[str] = None):
+    """Teach agents a new <tag>
+
+    Either an alias for a built-in action with fixed params:
+        register_action("place_sand", VoxelAction.PLACE_BLOCK, {"block_type": BlockType.SAND})
+    or a new action run by handler(agent, action, params):
+        register_action("fill", handler=fill_below, description="Fill the gap under the block ahead")
+    A description adds the tag to the agents' prompt.
+    """
+    if not VALID_TAG.fullmatch(tag) or tag in MODE_TAGS:
+        raise ValueError(f"invalid action tag: <{tag}>")
+    params = dict(params or {})
+    if handler is not None:
+        action = VoxelAction.CUSTOM
+        params["action"] = tag
+        CUSTOM_HANDLERS[tag] = handler
+    elif action == VoxelAction.CUSTOM:
+        raise ValueError(f"<{tag}> is a new action and needs a handler")
+    ACTION_TAGS[tag] = (action, params)
+    _TAG_RANK.setdefault(tag, len(_TAG_RANK))
+    if description:
+        EXTRA_ACTION_HELP[tag] = description
+
+
+def parse_action(content: str) -> Tuple[Optional[StreamMode], VoxelAction, Dict]:
+    """Mode switch (None if none) and the highest-priority action tag in one pass over the reply"""
+    mode = None
+    best_rank = len(_TAG_RANK)
+    best_tag = None
+    for m in ANY_TAG.finditer(content):
+        tag = m.group(1)
+        if tag in MODE_TAGS:
+            if mode is None or tag == "broadcast":
+                mode = MODE_TAGS[tag]
+            continue
+        rank = _TAG_RANK.get(tag.lower(), best_rank)
+        if rank < best_rank:
+            best_rank, best_tag = rank, tag.lower()
+    if best_tag is None:
+        return mode, VoxelAction.WAIT, {}
+    action, params = ACTION_TAGS[best_tag]
+    return mode, action, params
+
+
+register_action("place_sand", VoxelAction.PLACE_BLOCK, {"block_type": BlockType.SAND},
+                description="Place sand block ahead")
+
+
 @dataclass
 class VoxelPosition:
     x: float
@@ -65,6 +217,8 @@ class VoxelCraftClient:
         self.room = room
         self.client_id = None
         self.position = VoxelPosition(0, 120, 0, 0, 0)
+        self.world: Optional[ChunkCache] = None
+        self._world_seed = None
 
     def generate_client_id(self, name: str) -> str:
         """Generate a unique client ID"""
@@ -139,7 +293,6 @@ class VoxelCraftClient:
         self.position.yaw += dyaw
         self.position.pitch += dpitch
         # Clamp pitch
-        import math
         self.position.pitch = max(-math.pi/2, min(math.pi/2, self.position.pitch))
 
     def get_snapshot(self) -> Dict:
@@ -151,30 +304,83 @@ class VoxelCraftClient:
             print(f"Error getting snapshot: {e}")
             return {}
 
+    def world_for(self, seed) -> Optional[ChunkCache]:
+        """Local terrain for the room's seed (None until the room has one)"""
+        if not seed:
+            return None
+        if self.world is None or self._world_seed != seed:
+            self.world = ChunkCache(TerrainGenerator(seed))
+            self._world_seed = seed
+        return self.world
+
+    def query_region(self, cx: Optional[int] = None, cz: Optional[int] = None, r: int = 1) -> Dict[str, int]:
+        """Get edits ("x,y,z" -> block id) in chunks within r of (cx, cz), default: our own chunk"""
+        if cx is None or cz is None:
+            own_cx, own_cz = chunk_coords(int(round(self.position.x)), int(round(self.position.z)))
+            cx = own_cx if cx is None else cx
+            cz = own_cz if cz is None else cz
+        try:
+            response = requests.get(f"{self.base_url}/region",
+                                    params={"room": self.room, "cx": cx, "cz": cz, "r": r}, timeout=2)
+            return response.json().get("edits", {})
+        except Exception as e:
+            print(f"Error querying region: {e}")
+            return {}
+
 
 class VoxelAgent:
     """AI agent that operates in VoxelCraft world"""
 
     def __init__(self, name: str, client: OpenAI, voxel_client: VoxelCraftClient,
-                 color: str = "#ff0000", model: str = "gpt-4"):
+                 color: str = "#ff0000", model: str = "gpt-4", plan_mode: bool = False,
+                 trajectory: Optional[TrajectoryWriter] = None, cache: Optional[CompletionCache] = None,
+                 history_size: int = 256, context_messages: int = 24, context_actions: int = 8):
         self.name = name
         self.client = client
         self.voxel_client = voxel_client
         self.color = color
         self.model = model
-        self.action_history: List[str] = []
+        # Bounded histories: the newest history_size records are kept, and prompts show
+        # the last context_messages visible messages and context_actions actions
+        self.action_history: RingBuffer[ActionRecord] = RingBuffer(history_size)
         self.current_mode = StreamMode.INTERNAL
-        self.message_history: List[Dict] = []
+        self.message_history: RingBuffer[MessageRecord] = RingBuffer(history_size)
+        self.context_messages = context_messages
+        self.context_actions = context_actions
         self.task = None
+        self.perception: Optional[ObservationBuilder] = None
+        # Plan mode: one completion yields several actions, replayed on later ticks
+        self.plan_mode = plan_mode
+        self.plan: deque = deque()
+        self._plan_seq = 0  # message_history.total right after the plan was made
+        self._plan_cells: Dict[str, int] = {}  # edits the plan expects at and next to its targets
+        self.cache = cache  # opt-in completion cache
+        self.llm_calls = 0  # completions actually requested (cache hits don't count)
+        self.blocks_placed = 0
+        # Step logging: what led to the next executed action, and an optional scorer
+        self.trajectory = trajectory
+        self.reward_fn: Optional[Callable[["VoxelAgent"], float]] = None
+        self.steps_taken = 0
+        self._decision: Dict = {}
 
     def set_task(self, task: str):
         """Set the agent's current task/goal"""
         self.task = task
 
-    def get_world_description(self) -> str:
-        """Get a text description of the world state"""
+    def observe(self) -> Optional[Observation]:
+        """Egocentric voxel observation around the agent (None until the room has a seed)"""
+        world = self.voxel_client.world
+        if world is None:
+            return None
+        if self.perception is None or self.perception.world is not world:
+            self.perception = ObservationBuilder(world)
+        return self.perception.build(self.voxel_client.position)
+
+    def get_world_description(self, snapshot: Optional[Dict] = None) -> str:
+        """Get a text description of the world state (fetches a snapshot if none is given)"""
         pos = self.voxel_client.position
-        snapshot = self.voxel_client.get_snapshot()
+        if snapshot is None:
+            snapshot = self.voxel_client.get_snapshot()
 
         desc = f"""
 === {self.name}'s View ===
@@ -185,40 +391,57 @@ World Info:
 - Seed: {snapshot.get('seed', 'unknown')}
 - Edits: {len(snapshot.get('edits', {}))} blocks placed
 - Other players: {len(snapshot.get('clients', {}))}
-
-Other Players:
 """
+        world = self.voxel_client.world_for(snapshot.get('seed'))
+        if world is not None:
+            if 'edits' in snapshot:  # a failed fetch returns {}, which must not wipe the cache
+                world.sync_edits(snapshot['edits'])
+            bx, by, bz = int(round(pos.x)), int(round(pos.y)), int(round(pos.z))
+            desc += f"""- Ground height here: {world.surface_y(bx, bz)}
+- Block below you: {block_name(world.block_at(bx, by - 1, bz))}
+"""
+        recent = self.action_history.last(self.context_actions)
+        if recent:
+            desc += "- Your last actions: " + ", ".join(record.label for record in recent) + "\n"
+        desc += "\nOther Players:\n"
         clients = snapshot.get('clients', {})
         for cid, cdata in clients.items():
             if cdata.get('name') != self.name:
                 desc += f"  - {cdata.get('name')}: ({cdata.get('x'):.1f}, {cdata.get('y'):.1f}, {cdata.get('z'):.1f})\n"
 
+        if world is not None:
+            desc += "\n" + self.observe().to_text() + "\n"
+
         return desc
 
+    def remember_message(self, agent: str, content: str, mode: StreamMode):
+        """Record a message in this agent's own history"""
+        self.message_history.append(MessageRecord(agent, content, mode))
+
     def get_visible_messages(self) -> List[Dict]:
-        """Get messages this agent can see"""
+        """Get the last context_messages messages this agent can see"""
         visible = []
-        for msg in self.message_history:
-            mode = msg.get('mode', StreamMode.BROADCAST)
-            agent_name = msg.get('agent', self.name)
-
-            # Can see broadcast or own messages
-            if mode == StreamMode.BROADCAST or agent_name == self.name:
-                if agent_name == self.name:
-                    visible.append({
-                        "role": "assistant",
-                        "content": msg['content']
-                    })
-                else:
-                    visible.append({
-                        "role": "user",
-                        "content": f"[{agent_name}]: {msg['content']}"
-                    })
+        # Can see broadcast or own messages
+        for msg in self.message_history.last(
+                self.context_messages, lambda m: m.mode == StreamMode.BROADCAST or m.agent == self.name):
+            if msg.agent == self.name:
+                visible.append({
+                    "role": "assistant",
+                    "content": msg.content
+                })
+            else:
+                visible.append({
+                    "role": "user",
+                    "content": f"[{msg.agent}]: {msg.content}"
+                })
         return visible
 
-    def decide_action(self) -> Tuple[Optional[VoxelAction], Optional[Dict]]:
+    def decide_action(self, snapshot: Optional[Dict] = None) -> Tuple[Optional[VoxelAction], Optional[Dict]]:
         """AI decides what action to take"""
-        world_desc = self.get_world_description()
+        started = time.perf_counter()
+        if snapshot is None:
+            snapshot = self.voxel_client.get_snapshot()
+        world_desc = self.get_world_description(snapshot)
         messages = self.get_visible_messages()
 
         system_prompt = f"""You are {self.name}, an AI agent in a 3D voxel world (like Minecraft).
@@ -243,34 +466,44 @@ You have access to these tools:
 - <place_wood>: Place wood block ahead
 - <break_block>: Break block ahead
 - <wait>: Wait/observe
-
-Choose ONE action. Start in <internal> mode to think, then optionally use <broadcast> to communicate."""
+{registered_actions()}
+{self._action_instructions()} Start in <internal> mode to think, then optionally use <broadcast> to communicate."""
 
         messages.insert(0, {"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": world_desc})
 
         print(f"\n[{self.name}] Thinking...")
+        request = {"model": self.model, "messages": messages, "temperature": 0.7, "max_tokens": 200}
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=200
-            )
-
-            content = response.choices[0].message.content
+            content = self.cache.get(request) if self.cache else None
+            usage = None
+            if content is None:
+                self.llm_calls += 1
+                response = self.client.chat.completions.create(**request)
+                content = response.choices[0].message.content
+                usage = getattr(response, "usage", None)
+                if self.cache:
+                    self.cache.put(request, content)
+            else:
+                print(f"[{self.name}] 💾 Cached response")
+
             print(f"[{self.name}] Response: {content[:100]}...")
+            self._decision = {
+                "obs_hash": text_hash(world_desc),
+                "prompt_tokens": getattr(usage, "prompt_tokens", None) or -1,
+                "response": content,
+                "latency": time.perf_counter() - started,
+            }
 
             # Parse action from content
             action, params = self._parse_action(content)
+            if self.plan_mode:
+                self._start_plan(content, action, params, snapshot)
+                action, params = self.plan.popleft()
 
             # Store message
-            self.message_history.append({
-                'agent': self.name,
-                'content': content,
-                'mode': self.current_mode
-            })
+            self.remember_message(self.name, content, self.current_mode)
 
             return action, params
 
@@ -278,134 +511,285 @@ Choose ONE action. Start in <internal> mode to think, then optionally use <broad
             print(f"[{self.name}] Error: {e}")
             return VoxelAction.WAIT, {}
 
+    def _action_instructions(self) -> str:
+        if not self.plan_mode:
+            return "Choose ONE action."
+        return (f"Plan several actions ahead: list up to {MAX_PLAN_LENGTH} action tags in the order to run them. "
+                f"A trailing xN repeats the actions before it on that line, e.g. <move_up> <place_stone> x5. "
+                f"You will be asked again when the plan is done or something changes.")
+
+    def _parse_plan(self, content: str) -> List[Tuple[VoxelAction, Dict]]:
+        """All action tags in order, expanding xN repeats"""
+        plan: List[Tuple[VoxelAction, Dict]] = []
+        for line in content.lower().splitlines():
+            group = []
+            for m in PLAN_TOKEN.finditer(line):
+                if m.group(1):
+                    if m.group(1) in ACTION_TAGS:
+                        group.append(ACTION_TAGS[m.group(1)])
+                else:
+                    plan.extend(group * max(1, min(int(m.group(2)), MAX_PLAN_REPEAT)))
+                    group = []
+            plan.extend(group)
+        return plan[:MAX_PLAN_LENGTH]
+
+    def _start_plan(self, content: str, action: Optional[VoxelAction], params: Dict, snapshot: Dict):
+        plan = self._parse_plan(content)
+        self.plan = deque(plan or [(action or VoxelAction.WAIT, params or {})])
+        self._plan_seq = self.message_history.total
+        edits = snapshot.get('edits', {})
+        self._plan_cells = {}
+        for x, y, z in self._plan_targets():
+            for dx, dy, dz in ((0, 0, 0), (1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)):
+                key = f"{x + dx},{y + dy},{z + dz}"
+                self._plan_cells[key] = edits.get(key, 0)
+        if len(self.plan) > 1:
+            print(f"[{self.name}] 📋 Plan: {len(self.plan)} actions")
+
+    def _plan_targets(self) -> List[Tuple[int, int, int]]:
+        """Voxels the plan's PLACE_BLOCK / BREAK_BLOCK steps will edit, following its moves and turns
+
+        Stops at a custom action, which may move the agent in ways we can't predict.
+        """
+        pos = self.voxel_client.position
+        x, y, z, yaw = pos.x, pos.y, pos.z, pos.yaw
+        targets = []
+        for action, _ in self.plan:
+            if action in MOVE_STEPS[0]:
+                dx, dy, dz = move_step(action, yaw)
+                x, y, z = round(x + dx), round(y + dy), round(z + dz)
+            elif action in ROTATIONS:
+                yaw += ROTATIONS[action][0]
+            elif action in (VoxelAction.PLACE_BLOCK, VoxelAction.BREAK_BLOCK):
+                targets.append(edit_target(x, y, z, yaw))
+            elif action == VoxelAction.CUSTOM:
+                break
+        return targets
+
+    def _plan_still_valid(self, snapshot: Optional[Dict] = None) -> bool:
+        """Cheap local checks before replaying the next planned action"""
+        # A message from someone else arrived since planning
+        if any(msg.agent != self.name for msg in self.message_history.since(self._plan_seq)):
+            return False
+        # Someone else edited a voxel the plan builds on; edits elsewhere don't matter
+        if snapshot is None:
+            snapshot = self.voxel_client.get_snapshot()
+        if 'edits' in snapshot:  # a failed fetch returns {}, which tells us nothing
+            edits = snapshot['edits']
+            if any(edits.get(key, 0) != block_id for key, block_id in self._plan_cells.items()):
+                return False
+        # The next edit must still make sense where it lands
+        action, _ = self.plan[0]
+        target = self.action_target(action)
+        if target is not None:
+            key = "%d,%d,%d" % target
+            world = self.voxel_client.world
+            occupied = (self._plan_cells.get(key, 0) != 0 if world is None
+                        else world.block_at(*target) != 0)
+            if action == VoxelAction.PLACE_BLOCK and occupied:
+                return False
+            # Without terrain we only know about edits, so a break can't be ruled out
+            if action == VoxelAction.BREAK_BLOCK and world is not None and not occupied:
+                return False
+        return True
+
+    def next_action(self, snapshot: Optional[Dict] = None) -> Tuple[Optional[VoxelAction], Optional[Dict]]:
+        """Next action: replays the current plan while it holds, otherwise asks the model"""
+        if self.plan_mode and self.plan:
+            if self._plan_still_valid(snapshot):
+                action, params = self.plan.popleft()
+                self._decision = {"prompt_tokens": PLAN_STEP_TOKENS}
+                print(f"[{self.name}] 📋 Next planned action: {action.name} ({len(self.plan)} left)")
+                return action, params
+            print(f"[{self.name}] 📋 Plan invalidated, replanning")
+            self.plan.clear()
+        return self.decide_action(snapshot)
+
     def _parse_action(self, content: str) -> Tuple[Optional[VoxelAction], Dict]:
         """Parse action from AI response"""
-        content_lower = content.lower()
-
-        # Check mode switches
-        if "<broadcast>" in content:
-            self.current_mode = StreamMode.BROADCAST
-            print(f"[{self.name}] 🔄 Switched to BROADCAST")
-        elif "<internal>" in content:
-            self.current_mode = StreamMode.INTERNAL
-            print(f"[{self.name}] 🔄 Switched to INTERNAL")
-
-        # Parse movement actions
-        if "<move_forward>" in content_lower:
-            return VoxelAction.MOVE_FORWARD, {}
-        elif "<move_backward>" in content_lower:
-            return VoxelAction.MOVE_BACKWARD, {}
-        elif "<move_left>" in content_lower:
-            return VoxelAction.MOVE_LEFT, {}
-        elif "<move_right>" in content_lower:
-            return VoxelAction.MOVE_RIGHT, {}
-        elif "<move_up>" in content_lower:
-            return VoxelAction.MOVE_UP, {}
-        elif "<move_down>" in content_lower:
-            return VoxelAction.MOVE_DOWN, {}
-        elif "<turn_left>" in content_lower:
-            return VoxelAction.TURN_LEFT, {}
-        elif "<turn_right>" in content_lower:
-            return VoxelAction.TURN_RIGHT, {}
-        elif "<look_up>" in content_lower:
-            return VoxelAction.LOOK_UP, {}
-        elif "<look_down>" in content_lower:
-            return VoxelAction.LOOK_DOWN, {}
-
-        # Parse building actions
-        elif "<place_grass>" in content_lower:
-            return VoxelAction.PLACE_BLOCK, {"block_type": BlockType.GRASS}
-        elif "<place_stone>" in content_lower:
-            return VoxelAction.PLACE_BLOCK, {"block_type": BlockType.STONE}
-        elif "<place_wood>" in content_lower:
-            return VoxelAction.PLACE_BLOCK, {"block_type": BlockType.WOOD}
-        elif "<break_block>" in content_lower:
-            return VoxelAction.BREAK_BLOCK, {}
-        elif "<wait>" in content_lower:
-            return VoxelAction.WAIT, {}
+        mode, action, params = parse_action(content)
+        if mode is not None:
+            self.current_mode = mode
+            print(f"[{self.name}] 🔄 Switched to {mode.name}")
+        return action, params
+
+    def action_target(self, action: VoxelAction) -> Optional[Tuple[int, int, int]]:
+        """Voxel a PLACE_BLOCK / BREAK_BLOCK would edit (REACH blocks ahead), None for other actions"""
+        if action not in (VoxelAction.PLACE_BLOCK, VoxelAction.BREAK_BLOCK):
+            return None
+        pos = self.voxel_client.position
+        return edit_target(pos.x, pos.y, pos.z, pos.yaw)
 
-        return VoxelAction.WAIT, {}
+    def _expect_edit(self, x: int, y: int, z: int, block_id: int):
+        """Keep the plan's expected edits in step with our own edits"""
+        key = f"{x},{y},{z}"
+        if key in self._plan_cells:
+            self._plan_cells[key] = block_id
+        if self.voxel_client.world is not None:
+            self.voxel_client.world.set_block(x, y, z, block_id)
 
     def execute_action(self, action: VoxelAction, params: Dict):
         """Execute the chosen action - DISCRETE STEPPING"""
-        import math
-
-        if action == VoxelAction.MOVE_FORWARD:
-            # Move EXACTLY 1 block in the direction we're facing (discrete step)
-            dx = round(-math.sin(self.voxel_client.position.yaw))
-            dz = round(-math.cos(self.voxel_client.position.yaw))
-            self.voxel_client.move(dx=dx, dz=dz)
-
-        elif action == VoxelAction.MOVE_BACKWARD:
-            # Move EXACTLY 1 block backward (discrete step)
-            dx = round(math.sin(self.voxel_client.position.yaw))
-            dz = round(math.cos(self.voxel_client.position.yaw))
-            self.voxel_client.move(dx=dx, dz=dz)
-
-        elif action == VoxelAction.MOVE_LEFT:
-            # Strafe EXACTLY 1 block left (discrete step)
-            dx = round(-math.cos(self.voxel_client.position.yaw))
-            dz = round(math.sin(self.voxel_client.position.yaw))
-            self.voxel_client.move(dx=dx, dz=dz)
-
-        elif action == VoxelAction.MOVE_RIGHT:
-            # Strafe EXACTLY 1 block right (discrete step)
-            dx = round(math.cos(self.voxel_client.position.yaw))
-            dz = round(-math.sin(self.voxel_client.position.yaw))
-            self.voxel_client.move(dx=dx, dz=dz)
-
-        elif action == VoxelAction.MOVE_UP:
-            # Move EXACTLY 1 block up (discrete step)
-            self.voxel_client.move(dy=1)
-
-        elif action == VoxelAction.MOVE_DOWN:
-            # Move EXACTLY 1 block down (discrete step)
-            self.voxel_client.move(dy=-1)
-
-        elif action == VoxelAction.TURN_LEFT:
-            self.voxel_client.rotate(dyaw=math.pi/4)
-
-        elif action == VoxelAction.TURN_RIGHT:
-            self.voxel_client.rotate(dyaw=-math.pi/4)
-
-        elif action == VoxelAction.LOOK_UP:
-            self.voxel_client.rotate(dpitch=-0.3)
-
-        elif action == VoxelAction.LOOK_DOWN:
-            self.voxel_client.rotate(dpitch=0.3)
-
-        elif action == VoxelAction.PLACE_BLOCK:
-            # Place block in front of agent
-            block_type = params.get('block_type', BlockType.GRASS)
-            pos = self.voxel_client.position
-            # Calculate block position ahead
-            bx = int(pos.x - math.sin(pos.yaw) * 3)
-            by = int(pos.y)
-            bz = int(pos.z - math.cos(pos.yaw) * 3)
-            self.voxel_client.place_block(bx, by, bz, block_type)
-
-        elif action == VoxelAction.BREAK_BLOCK:
-            # Break block in front
-            pos = self.voxel_client.position
-            bx = int(pos.x - math.sin(pos.yaw) * 3)
-            by = int(pos.y)
-            bz = int(pos.z - math.cos(pos.yaw) * 3)
-            self.voxel_client.break_block(bx, by, bz)
+        if action == VoxelAction.CUSTOM:
+            handler = CUSTOM_HANDLERS.get(params.get('action'))
+        else:
+            handler = ACTION_HANDLERS.get(action)
+        if handler:
+            handler(self, action, params)
 
         # Update position on server
         self.voxel_client.send_position(self.name, self.color)
         pos = self.voxel_client.position
-        print(f"[{self.name}] ✓ Executed {action.name} | Now at ({pos.x:.1f}, {pos.y:.1f}, {pos.z:.1f})")
+        label = params.get('action', action.name) if action == VoxelAction.CUSTOM else action.name
+        print(f"[{self.name}] ✓ Executed {label} | Now at ({pos.x:.1f}, {pos.y:.1f}, {pos.z:.1f})")
+        if 'block_type' in params:
+            label += f"({params['block_type'].name})"
+        self.action_history.append(ActionRecord(action, label, pos.x, pos.y, pos.z))
+        if self.trajectory:
+            self._log_step(action, params)
+        self.steps_taken += 1
+
+    def _log_step(self, action: VoxelAction, params: Dict):
+        pos = self.voxel_client.position
+        decision, self._decision = self._decision, {}
+        self.trajectory.log_step(
+            time=time.time(), step=self.steps_taken, agent=self.name, action=ACTION_CODES[action],
+            x=pos.x, y=pos.y, z=pos.z, yaw=pos.yaw, pitch=pos.pitch,
+            reward=self.reward_fn(self) if self.reward_fn else float("nan"),
+            params=params_json(params), **decision)
+
+
+def _move(agent: VoxelAgent, action: VoxelAction, params: Dict):
+    # Move EXACTLY 1 block (discrete step)
+    dx, dy, dz = move_step(action, agent.voxel_client.position.yaw)
+    agent.voxel_client.move(dx=dx, dy=dy, dz=dz)
+
+
+def _rotate(agent: VoxelAgent, action: VoxelAction, params: Dict):
+    dyaw, dpitch = ROTATIONS[action]
+    agent.voxel_client.rotate(dyaw=dyaw, dpitch=dpitch)
+
+
+def _place(agent: VoxelAgent, action: VoxelAction, params: Dict):
+    # Place block in front of agent
+    block_type = params.get('block_type', BlockType.GRASS)
+    bx, by, bz = agent.action_target(action)
+    agent.voxel_client.place_block(bx, by, bz, block_type)
+    agent.blocks_placed += 1
+    agent._expect_edit(bx, by, bz, block_type.value)
+
+
+def _break(agent: VoxelAgent, action: VoxelAction, params: Dict):
+    # Break block in front
+    bx, by, bz = agent.action_target(action)
+    agent.voxel_client.break_block(bx, by, bz)
+    agent._expect_edit(bx, by, bz, 0)
+
+
+ACTION_HANDLERS: Dict[VoxelAction, Callable] = {
+    **{action: _move for action in MOVE_STEPS[0]},
+    **{action: _rotate for action in ROTATIONS},
+    VoxelAction.PLACE_BLOCK: _place,
+    VoxelAction.BREAK_BLOCK: _break,
+}
+
+
+def registered_actions() -> str:
+    """Prompt lines for tags added with register_action(description=...)"""
+    return "".join(f"- <{tag}>: {text}\n" for tag, text in EXTRA_ACTION_HELP.items())
+
+
+def open_trajectory(path: str) -> TrajectoryWriter:
+    """Trajectory log whose action codes are VoxelAction positions"""
+    return TrajectoryWriter(path, [action.name for action in VoxelAction])
+
+
+def benchmark_parse(n: int = 100000):
+    """Time parse_action over n synthetic replies"""
+    rng = random.Random(0)
+    tags = list(ACTION_TAGS)
+    filler = ("I should look around first. ", "The tower needs to be taller. ",
+              "Bob is building nearby, ", "Let me check the ground. ")
+    replies = []
+    for _ in range(n):
+        parts = [rng.choice(filler) for _ in range(rng.randint(1, 6))]
+        parts.insert(rng.randint(0, len(parts)), f"<{rng.choice(tags)}>")
+        if rng.random() < 0.3:
+            parts.insert(0, rng.choice(("<internal> ", "<broadcast> ")))
+        replies.append("".join(parts))
+
+    start = time.perf_counter()
+    for reply in replies:
+        parse_action(reply)
+    elapsed = time.perf_counter() - start
+    print(f"parse_action: {n} replies in {elapsed:.2f}s ({n / elapsed:,.0f} replies/s)")
+
+
+def resolve_conflicts(agents: List[VoxelAgent], decisions: List[Tuple[Optional[VoxelAction], Optional[Dict]]],
+                      tick: int) -> List[Tuple[VoxelAgent, VoxelAction, Dict]]:
+    """Order one tick's decisions deterministically; of several edits to one voxel only the first wins
+
+    Priority rotates by tick so no agent always wins ties.
+    """
+    start = tick % len(agents) if agents else 0
+    order = list(range(start, len(agents))) + list(range(start))
+    claimed = {}
+    resolved = []
+    for i in order:
+        agent = agents[i]
+        action, params = decisions[i]
+        if not action:
+            continue
+        params = params or {}
+        target = agent.action_target(action)
+        if target is not None:
+            if target in claimed:
+                print(f"[{agent.name}] ⚠️ {action.name} at {target} conflicts with {claimed[target]}, waiting instead")
+                action, params = VoxelAction.WAIT, {}
+            else:
+                claimed[target] = agent.name
+        resolved.append((agent, action, params))
+    return resolved
+
+
+async def run_tick(agents: List[VoxelAgent], tick: int):
+    """One tick: every agent decides in parallel on the same snapshot, then actions apply in order"""
+    import asyncio
+
+    snapshot = await asyncio.to_thread(agents[0].voxel_client.get_snapshot) if agents else {}
+    seen = [agent.message_history.total for agent in agents]
+    decisions = await asyncio.gather(*(asyncio.to_thread(agent.next_action, snapshot) for agent in agents))
+
+    for agent, action, params in resolve_conflicts(agents, decisions, tick):
+        agent.execute_action(action, params)
+
+    # Broadcasts made this tick become visible to the others from the next tick on
+    broadcasts = [(agent, msg) for agent, start in zip(agents, seen)
+                  for msg in agent.message_history.since(start)
+                  if msg.agent == agent.name and msg.mode == StreamMode.BROADCAST]
+    for agent, msg in broadcasts:
+        for other in agents:
+            if other != agent:
+                other.remember_message(msg.agent, msg.content, msg.mode)
 
 
-async def run_voxelcraft_agents():
-    """Run multiple AI agents in VoxelCraft world"""
+async def run_voxelcraft_agents(tick_rate: float = 2.0, plan_mode: bool = True,
+                                trajectory_dir: Optional[str] = None, cache_path: Optional[str] = None):
+    """Run multiple AI agents in VoxelCraft world
+
+    tick_rate caps ticks per second; a tick never waits longer than its slowest agent needs.
+    plan_mode lets each completion queue several actions instead of one.
+    trajectory_dir, if set, logs every step there (see trajectory_log.py).
+    cache_path, if set, reuses completions for identical prompts across runs (SQLite file).
+    """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         print("⚠️  Please set OPENAI_API_KEY in .env file")
         return
 
     client = OpenAI(api_key=api_key)
+    trajectory = open_trajectory(trajectory_dir) if trajectory_dir else None
+    cache = CompletionCache(cache_path, samples=3) if cache_path else None
 
     # Create VoxelCraft clients for each agent
     room = "ai_agents"
@@ -422,13 +806,16 @@ async def run_voxelcraft_agents():
     charlie_client.position = VoxelPosition(0, 120, -5, 0, 0)  # North of player
 
     # Create AI agents with tasks that build UPWARD (easy to see)
-    alice = VoxelAgent("Alice", client, alice_client, color="#ff0000")
+    alice = VoxelAgent("Alice", client, alice_client, color="#ff0000", plan_mode=plan_mode,
+                       trajectory=trajectory, cache=cache)
     alice.set_task("Build a tall STONE tower directly upward - place blocks ABOVE your current position using <move_up> then <place_stone>")
 
-    bob = VoxelAgent("Bob", client, bob_client, color="#00ff00")
+    bob = VoxelAgent("Bob", client, bob_client, color="#00ff00", plan_mode=plan_mode,
+                     trajectory=trajectory, cache=cache)
     bob.set_task("Build a tall WOOD tower directly upward - place blocks ABOVE your current position using <move_up> then <place_wood>")
 
-    charlie = VoxelAgent("Charlie", client, charlie_client, color="#0000ff")
+    charlie = VoxelAgent("Charlie", client, charlie_client, color="#0000ff", plan_mode=plan_mode,
+                         trajectory=trajectory, cache=cache)
     charlie.set_task("Build a tall GRASS tower directly upward - place blocks ABOVE your current position using <move_up> then <place_grass>")
 
     agents = [alice, bob, charlie]
@@ -454,44 +841,40 @@ async def run_voxelcraft_agents():
 
     print("\nStarting AI agent loop (20 turns)...\n")
 
-    # Main loop: agents take turns
+    # Main loop: all agents act once per turn, deciding concurrently
+    import asyncio
     max_turns = 20
+    tick_interval = 1.0 / tick_rate if tick_rate > 0 else 0.0
+    # Towers are scored around where each agent starts
+    towers = {agent.name: TowerTask(block.value, int(agent.voxel_client.position.x),
+                                    int(agent.voxel_client.position.z), height=max_turns, radius=4)
+              for agent, block in zip(agents, (BlockType.STONE, BlockType.WOOD, BlockType.GRASS))}
     for turn in range(max_turns):
         print(f"\n{'='*60}")
         print(f"TURN {turn + 1}/{max_turns}")
         print(f"{'='*60}")
 
-        for agent in agents:
-            print(f"\n--- {agent.name}'s Turn ---")
-
-            # Agent decides action
-            action, params = agent.decide_action()
-
-            if action:
-                # Execute action
-                agent.execute_action(action, params)
+        turn_start = time.perf_counter()
+        await run_tick(agents, turn)
+        elapsed = time.perf_counter() - turn_start
+        print(f"\n⏱️ Turn took {elapsed:.2f}s")
 
-                # Share message with other agents if in broadcast mode
-                if agent.current_mode == StreamMode.BROADCAST and agent.message_history:
-                    last_msg = agent.message_history[-1]
-                    for other in agents:
-                        if other != agent:
-                            other.message_history.append(last_msg)
-
-            # Small delay
-            time.sleep(0.5)
-
-        # Pause between turns
-        time.sleep(1)
+        # Hold the tick rate without adding delay when the agents were slower than a tick
+        if elapsed < tick_interval:
+            await asyncio.sleep(tick_interval - elapsed)
 
     print("\n" + "="*60)
     print("🏁 AI AGENTS COMPLETE! 🏁")
     print("="*60)
     print("\n🏗️ BUILDING SUMMARY:")
     print("="*60)
+    engine = RewardEngine(towers)
+    engine.apply_edits(agents[0].voxel_client.get_snapshot().get('edits', {}))
     for agent in agents:
         pos = agent.voxel_client.position
-        print(f"📍 {agent.name}: Final position ({pos.x:.1f}, {pos.y:.1f}, {pos.z:.1f})")
+        print(f"📍 {agent.name}: Final position ({pos.x:.1f}, {pos.y:.1f}, {pos.z:.1f}) | "
+              f"{agent.blocks_placed} blocks placed with {agent.llm_calls} LLM calls | "
+              f"verified tower height {towers[agent.name].built_height()}")
 
     print("\n💡 TO VIEW THE STRUCTURES:")
     print("="*60)
@@ -503,7 +886,19 @@ async def run_voxelcraft_agents():
     print("  - Charlie's GRASS tower: North (Z-)")
     print("="*60)
 
+    if cache:
+        stats = cache.stats()
+        print(f"💾 Completion cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%})")
+        cache.close()
+    if trajectory:
+        trajectory.close()
+        print(f"📼 Logged {trajectory.written} steps to {trajectory_dir} ({trajectory.dropped} dropped)")
+
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(run_voxelcraft_agents())
+    import sys
+    if "--bench-parse" in sys.argv:
+        benchmark_parse()
+    else:
+        import asyncio
+        asyncio.run(run_voxelcraft_agents())
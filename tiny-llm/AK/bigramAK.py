@@ -1,7 +1,12 @@
+import os
+import sys
 import torch
 import torch.nn as nn
 from torch.nn import functional as F
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # tiny-llm/, for data_loader
+from data_loader import BatchLoader
+
 # hyperparameters
 batch_size = 32 # how many independent sequences will we process in parallel?
 block_size = 8 # what is the maximum context length for predictions?
@@ -34,15 +39,22 @@ train_data = data[:n]
 val_data = data[n:]
 
 # data loading
-def get_batch(split):
-    # generate a small batch of data of inputs x and targets y
+def sample_batch(split, generator=None):
+    # generate a small batch of data of inputs x and targets y, on the cpu
     data = train_data if split == 'train' else val_data
-    ix = torch.randint(len(data) - block_size, (batch_size,))
+    ix = torch.randint(len(data) - block_size, (batch_size,), generator=generator)
     x = torch.stack([data[i:i+block_size] for i in ix])
     y = torch.stack([data[i+1:i+block_size+1] for i in ix])
+    return x, y
+
+def get_batch(split):
+    x, y = sample_batch(split)
     x, y = x.to(device), y.to(device)
     return x, y
 
+# training batches are built on a background thread while the previous step runs
+train_loader = BatchLoader(lambda g: sample_batch('train', g), device=device)
+
 @torch.no_grad()
 def estimate_loss():
     out = {}
@@ -112,7 +124,7 @@ for iter in range(max_iters):
         context = torch.zeros((1, 1), dtype=torch.long, device=device)
         print(decode(m.generate(context, max_new_tokens=500)[0].tolist()))
     # sample a batch of data
-    xb, yb = get_batch('train')
+    xb, yb = next(train_loader)
 
     # evaluate the loss
     logits, loss = model(xb, yb)
@@ -120,4 +132,6 @@ for iter in range(max_iters):
     loss.backward()
     optimizer.step()
 
+train_loader.close()
+
 
@@ -1,7 +1,13 @@
+import os
+import sys
 import torch
 import torch.nn as nn
 from torch.nn import functional as F
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # tiny-llm/, for data_loader
+from checkpoint_compat import convert_state_dict
+from data_loader import BatchLoader
+
 # hyperparameters
 batch_size = 64 # how many independent sequences will we process in parallel?
 block_size = 256 # what is the maximum context length for predictions?
@@ -39,15 +45,22 @@ train_data = data[:n]
 val_data = data[n:]
 
 # data loading
-def get_batch(split):
-    # generate a small batch of data of inputs x and targets y
+def sample_batch(split, generator=None):
+    # generate a small batch of data of inputs x and targets y, on the cpu
     data = train_data if split == 'train' else val_data
-    ix = torch.randint(len(data) - block_size, (batch_size,))
+    ix = torch.randint(len(data) - block_size, (batch_size,), generator=generator)
     x = torch.stack([data[i:i+block_size] for i in ix])
     y = torch.stack([data[i+1:i+block_size+1] for i in ix])
+    return x, y
+
+def get_batch(split):
+    x, y = sample_batch(split)
     x, y = x.to(device), y.to(device)
     return x, y
 
+# training batches are built on a background thread while the previous step runs
+train_loader = BatchLoader(lambda g: sample_batch('train', g), device=device)
+
 @torch.no_grad()
 def estimate_loss():
     out = {}
@@ -62,45 +75,32 @@ def estimate_loss():
     model.train()
     return out
 
-class Head(nn.Module):
-    """ one head of self-attention """
-
-    def __init__(self, head_size):
-        super().__init__()
-        self.key = nn.Linear(n_embd, head_size, bias=False)
-        self.query = nn.Linear(n_embd, head_size, bias=False)
-        self.value = nn.Linear(n_embd, head_size, bias=False)
-        self.register_buffer('tril', torch.tril(torch.ones(block_size, block_size)))
-
-        self.dropout = nn.Dropout(dropout)
-
-    def forward(self, x):
-        # input of size (batch, time-step, channels)
-        # output of size (batch, time-step, head size)
-        B,T,C = x.shape
-        k = self.key(x)   # (B,T,hs)
-        q = self.query(x) # (B,T,hs)
-        # compute attention scores ("affinities")
-        wei = q @ k.transpose(-2,-1) * k.shape[-1]**-0.5 # (B, T, hs) @ (B, hs, T) -> (B, T, T)
-        wei = wei.masked_fill(self.tril[:T, :T] == 0, float('-inf')) # (B, T, T)
-        wei = F.softmax(wei, dim=-1) # (B, T, T)
-        wei = self.dropout(wei)
-        # perform the weighted aggregation of the values
-        v = self.value(x) # (B,T,hs)
-        out = wei @ v # (B, T, T) @ (B, T, hs) -> (B, T, hs)
-        return out
-
 class MultiHeadAttention(nn.Module):
-    """ multiple heads of self-attention in parallel """
+    """ multiple heads of self-attention in parallel, from one fused qkv projection """
 
     def __init__(self, num_heads, head_size):
         super().__init__()
-        self.heads = nn.ModuleList([Head(head_size) for _ in range(num_heads)])
+        self.num_heads = num_heads
+        self.head_size = head_size
+        # rows: all heads' queries, then keys, then values
+        self.qkv = nn.Linear(n_embd, 3 * num_heads * head_size, bias=False)
+        self.register_buffer('tril', torch.tril(torch.ones(block_size, block_size)), persistent=False)
+        self.attn_dropout = nn.Dropout(dropout)
         self.proj = nn.Linear(head_size * num_heads, n_embd)
         self.dropout = nn.Dropout(dropout)
 
     def forward(self, x):
-        out = torch.cat([h(x) for h in self.heads], dim=-1)
+        # input of size (batch, time-step, channels)
+        B,T,C = x.shape
+        q, k, v = self.qkv(x).view(B, T, 3, self.num_heads, self.head_size).permute(2, 0, 3, 1, 4) # each (B, nh, T, hs)
+        if hasattr(F, 'scaled_dot_product_attention'):
+            out = F.scaled_dot_product_attention(q, k, v, dropout_p=dropout if self.training else 0.0, is_causal=True)
+        else:
+            wei = q @ k.transpose(-2,-1) * self.head_size**-0.5 # (B, nh, T, T)
+            wei = wei.masked_fill(self.tril[:T, :T] == 0, float('-inf'))
+            wei = self.attn_dropout(F.softmax(wei, dim=-1))
+            out = wei @ v # (B, nh, T, hs)
+        out = out.transpose(1, 2).reshape(B, T, self.num_heads * self.head_size)
         out = self.dropout(self.proj(out))
         return out
 
@@ -158,6 +158,10 @@ class GPTLanguageModel(nn.Module):
         elif isinstance(module, nn.Embedding):
             torch.nn.init.normal_(module.weight, mean=0.0, std=0.02)
 
+    def load_state_dict(self, state_dict, *args, **kwargs):
+        # also accepts checkpoints saved before attention was fused
+        return super().load_state_dict(convert_state_dict(state_dict), *args, **kwargs)
+
     def forward(self, idx, targets=None):
         B, T = idx.shape
 
@@ -216,7 +220,7 @@ for iter in range(max_iters):
         print(f"step {iter}: train loss {losses['train']:.4f}, val loss {losses['val']:.4f}")
 
     # sample a batch of data
-    xb, yb = get_batch('train')
+    xb, yb = next(train_loader)
 
     # evaluate the loss
     logits, loss = model(xb, yb)
@@ -227,6 +231,8 @@ for iter in range(max_iters):
     # Track loss
     loss_history.append(loss.item())
 
+train_loader.close()
+
 # Save model checkpoint after training
 checkpoint = {
     'model_state_dict': m.state_dict(),
@@ -6,6 +6,8 @@ import matplotlib.pyplot as plt
 from matplotlib.colors import LogNorm
 import torch.nn.functional as F
 
+from data_loader import BatchLoader
+
 import os
 os.system('clear')
 os.system('clear')
@@ -94,30 +96,26 @@ L1 @ [???,len(char)]
 
 "Create the Traning set"
 
-X, Y = [], []
-
-for w in words:
-    chs = ['@'] + list(w) + ['@']
-
-    for i in range(1,len(chs)):
-        if i < MAXWCHARS:
-            inp = ('*'*(MAXWCHARS-i)) + ''.join(chs[:i])
-        else:
-            inp = ''.join(chs[i-MAXWCHARS:i])
-        out = chs[i]
-        
-        # print(f'[{inp}] : |{out}|')
-
-        X.append([stoi[i] for i in inp])
-        Y.append(stoi[out])
-
-X = torch.tensor(X, dtype=torch.long)
-Y = torch.tensor(Y, dtype=torch.long)
-
-split = int(len(X) * 0.8)
-
-Xtr, Xva = X[:split], X[split:]
-Ytr, Yva = Y[:split], Y[split:]
+# Every word is encoded once into one flat stream, @name@@name@..., instead of a padded
+# MAXWCHARS string per character. Example k predicts enc[tgt[k]] from the MAXWCHARS ids
+# before it, with '*' wherever the window reaches back past first[k], the start of its word.
+lens = torch.tensor([len(w) + 2 for w in words])
+enc = torch.tensor([stoi[c] for w in words for c in '@' + w + '@'], dtype=torch.int16)
+starts = lens.cumsum(0) - lens
+is_target = torch.ones(len(enc), dtype=torch.bool)
+is_target[starts] = False
+tgt = is_target.nonzero().squeeze(1)
+first = starts.repeat_interleave(lens - 1)
+window = torch.arange(MAXWCHARS) - MAXWCHARS
+
+def windows(ix):
+    """(X, Y) for examples ix, built on demand: X is (len(ix), MAXWCHARS), left-padded with '*'"""
+    pos = tgt[ix, None] + window
+    X = enc[pos.clamp(min=0)].long()
+    X[pos < first[ix, None]] = stoi['*']
+    return X, enc[tgt[ix]].long()
+
+split = int(len(tgt) * 0.8)
 
 # emb @ W1 + b1
 """
@@ -154,16 +152,23 @@ lossi = []
 for p in parameters:
     p.requires_grad = True
 
+def get_batch(generator=None):
+    ix = torch.randint(0, split, ((32,)), generator=generator)
+    return windows(ix)
+
+# minibatches are built on a background thread while the previous step runs
+loader = BatchLoader(get_batch)
+
 for i in range(30000):
     # contruct minibatch
-    ix = torch.randint(0, Xtr.shape[0], ((32,)))
+    Xb, Yb = next(loader)
 
     # forward pass
-    emb = C[Xtr[ix]]
+    emb = C[Xb]
     # print(emb.shape[0],emb.shape[1],emb.shape[2])
     h = torch.tanh(emb.view(emb.shape[0], emb.shape[1]*emb.shape[2]) @ W1 + b1)
     logits = h @ W2 + b2
-    loss = F.cross_entropy(logits, Ytr[ix])
+    loss = F.cross_entropy(logits, Yb)
     print(loss.item())
 
     # backward pass
@@ -185,14 +190,19 @@ for i in range(30000):
     lri.append(lr)
     lossi.append(loss.item())
 
-
-# forward pass
-emb = C[Xva]
-# print(emb.shape[0],emb.shape[1],emb.shape[2])
-h = torch.tanh(emb.view(emb.shape[0], emb.shape[1]*emb.shape[2]) @ W1 + b1)
-logits = h @ W2 + b2
-loss = F.cross_entropy(logits, Yva)
-print(f'Loss: {loss.item()}')
+loader.close()
+
+# forward pass over the validation examples, a chunk of windows at a time
+with torch.no_grad():
+    loss = 0.0
+    for ix in torch.arange(split, len(tgt)).split(256):
+        Xb, Yb = windows(ix)
+        emb = C[Xb]
+        h = torch.tanh(emb.view(emb.shape[0], emb.shape[1]*emb.shape[2]) @ W1 + b1)
+        logits = h @ W2 + b2
+        loss += F.cross_entropy(logits, Yb, reduction='sum').item()
+    loss /= len(tgt) - split
+print(f'Loss: {loss}')
 
 
 # save
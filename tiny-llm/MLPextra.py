@@ -52,37 +52,43 @@ parameters = [C,W1,b1,W2,b2]
 
 "Generating"
 
-out = ['@']
-
-for i in range(1000):
-
-    if len(out) <= MAXWCHARS:
-        inp = ('*'*(MAXWCHARS-len(out))) + ''.join(out)
-    else:
-        inp = ''.join(out[-MAXWCHARS:])
-
-
-    # print(f'|{inp}|')
-    X = []
-    X.append([stoi[i] for i in inp])
-    X = torch.tensor(X, dtype=torch.long)
-
-    # forward pass
-    emb = C[X]
-    # print(emb.shape[0],emb.shape[1],emb.shape[2])
-    h = torch.tanh(emb.view(emb.shape[0], emb.shape[1]*emb.shape[2]) @ W1 + b1)
-    logits = h @ W2 + b2
-
-    # soft-max beging
-    counts = logits.exp() # equivalent to N
-    probs = counts / counts.sum(1, keepdim=True)
-    # soft-max end
-
-    res = torch.multinomial(probs[-1], num_samples=1).item()
-
-    out.append(chars[res])
-    
-    if res == 0:
-        break
-
-print(''.join(out))
\ No newline at end of file
+def generate(n, max_len=1000, batch_size=256, generator=None):
+    """n samples, batch_size at a time; each row stops at its first '@' (index 0)"""
+    pad, stop = stoi['*'], stoi['@']
+    samples = []
+    for start in range(0, n, batch_size):
+        B = min(batch_size, n - start)
+        # Rolling context: row r's window at step t is buf[r, t:t+MAXWCHARS], so writing the
+        # sampled id at t+MAXWCHARS slides it along without rebuilding the padded string
+        buf = torch.full((B, MAXWCHARS + max_len), pad, dtype=torch.long)
+        buf[:, MAXWCHARS - 1] = stop
+        length = torch.full((B,), max_len) # ids sampled per row, the stop included
+        alive = torch.arange(B) # rows still generating; finished rows drop out of the batch
+
+        for t in range(max_len):
+            X = buf[alive, t:t + MAXWCHARS]
+
+            # forward pass
+            emb = C[X]
+            h = torch.tanh(emb.view(emb.shape[0], emb.shape[1]*emb.shape[2]) @ W1 + b1)
+            logits = h @ W2 + b2
+
+            # soft-max beging
+            counts = logits.exp() # equivalent to N
+            probs = counts / counts.sum(1, keepdim=True)
+            # soft-max end
+
+            res = torch.multinomial(probs, num_samples=1, generator=generator).squeeze(1)
+            buf[alive, t + MAXWCHARS] = res
+
+            ended = res == stop
+            length[alive[ended]] = t + 1
+            alive = alive[~ended]
+            if len(alive) == 0:
+                break
+
+        for row, k in zip(buf[:, MAXWCHARS - 1:].tolist(), length.tolist()):
+            samples.append(''.join(itos[i] for i in row[:k + 1]))
+    return samples
+
+print(generate(1)[0])
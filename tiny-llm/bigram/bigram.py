@@ -19,8 +19,10 @@ chars.insert(0,'.')
 stoi = {s: i for i, s in enumerate(chars)}
 # index -> string
 itos = {i: s for i, s in enumerate(chars)}
-# Bigram count matrix sized by vocab
-# N = torch.zeros(len(chars), len(chars), dtype=torch.int64)
+V = len(chars)
+
+FULL_BATCH = True # False: train on random minibatches of BATCH_SIZE bigrams
+BATCH_SIZE = 4096
 
 "Create the Traning set"
 xs = []
@@ -41,11 +43,12 @@ xs = torch.tensor(xs)
 num = xs.nelement()
 ys = torch.tensor(ys)
 
-xenc = F.one_hot(xs,num_classes=27).float()
+# Bigram count matrix: N[ix1, ix2] = how often ix2 follows ix1
+N = torch.bincount(xs * V + ys, minlength=V * V).view(V, V)
 
 
 
-W = torch.randn((27,27), requires_grad=True)
+W = torch.randn((V,V), requires_grad=True)
 W.shape
 
 "Traning"
@@ -57,13 +60,20 @@ for k in range(200):
 
 
     # forward pass
-    logits = xenc @ W #log-counts
-    # soft-max beging
-    counts = logits.exp() # equivalent to N
-    probs = counts / counts.sum(1, keepdim=True)
-    # soft-max end
-    # loss = -probs[torch.arange(num), ys].log().mean() + 0.01*(W**2).mean() # this is called regularazation which equals to P = (N+1).float() 
-    loss = -probs[torch.arange(num), ys].log().mean() # Here we compare it with the YS
+    if FULL_BATCH:
+        # Every bigram with the same first char gets the same row of probabilities, so the
+        # mean over all bigrams is the per-row log-probs weighted by the counts N
+        logprobs = W.log_softmax(1) # (V, V) instead of (num, V)
+        loss = -(N * logprobs).sum() / num
+    else:
+        ix = torch.randint(0, num, (BATCH_SIZE,))
+        logits = W[xs[ix]] #log-counts, the rows of W one_hot(xs) @ W would pick
+        # soft-max beging
+        counts = logits.exp() # equivalent to N
+        probs = counts / counts.sum(1, keepdim=True)
+        # soft-max end
+        # loss = -probs[torch.arange(BATCH_SIZE), ys[ix]].log().mean() + 0.01*(W**2).mean() # this is called regularazation which equals to P = (N+1).float() 
+        loss = -probs[torch.arange(BATCH_SIZE), ys[ix]].log().mean() # Here we compare it with the YS
     print(loss.item())
 
     # backward pass
@@ -97,42 +107,34 @@ for let in range(0):
 
 
 "Generating"
-def gen(xs):
-    xs = torch.tensor(xs)
-
-    xenc = F.one_hot(xs,num_classes=27).float()
-
-    # forward pass
-    logits = xenc @ W #log-counts
-    # soft-max beging
-    counts = logits.exp() # equivalent to N
-    probs = counts / counts.sum(1, keepdim=True)
-    # soft-max end
-    return torch.multinomial(probs[-1], num_samples=1).item()
-
-
-for _ in range(10):
-    out = [0]
-    while True:
-        res = gen(out)
-        out.append(res)
-        
-        if res == 0:
+def gen(n, max_len=100, generator=None):
+    """n names sampled in parallel, each from '.' up to its first '.' (index 0) after it"""
+    with torch.no_grad():
+        P = W.softmax(1) # the row of next-char probabilities for every char
+    ix = torch.zeros(n, dtype=torch.long) # rolling context: the last char of every row
+    out = torch.zeros((n, max_len), dtype=torch.long)
+    alive = torch.arange(n) # rows still generating; finished rows drop out of the batch
+    for t in range(max_len):
+        ix = torch.multinomial(P[ix], num_samples=1, generator=generator).squeeze(1)
+        out[alive, t] = ix
+        going = ix != 0
+        ix, alive = ix[going], alive[going]
+        if len(alive) == 0:
             break
-    print("".join([chars[pred_ix] for pred_ix in out]))
 
+    names = []
+    for row in out[:, :t + 1].tolist():
+        end = row.index(0) + 1 if 0 in row else len(row)
+        names.append('.' + ''.join(chars[i] for i in row[:end]))
+    return names
 
-"OLD Traning"
-# for w in words:
-#     chs = ['.'] + list(w) + ['.']
-#     for i in range(1,len(chs)):
-#         ch1 = chs[i-1]
-#         ch2 = chs[i]
-#         ix1 = stoi[ch1]
-#         ix2 = stoi[ch2]
 
-#         N[ix1,ix2] += 1
+for name in gen(10):
+    print(name)
+
 
+"OLD Traning"
+# counting model straight from N (built above with bincount)
 # # P = (N+1).float() # this is called model smoothing 
 # P = (N).float()
 # P = P / P.sum(1, keepdim=True)
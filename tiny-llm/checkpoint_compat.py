@@ -0,0 +1,26 @@
+'''
+Checkpoint layout conversion shared by gpt_model.py and AK/gptAK.py.
+
+Both models used to keep one Head module per attention head (heads.<i>.query/key/value)
+and now use one fused qkv projection. convert_state_dict maps old checkpoints onto the
+new layout. Importing this module has no side effects, unlike the training scripts.
+'''
+
+import re
+
+import torch
+
+
+def convert_state_dict(state_dict):
+    """Map checkpoints from the per-Head layout (heads.<i>.query/key/value) onto the fused qkv one"""
+    out, per_head = {}, {}
+    for name, w in state_dict.items():
+        m = re.match(r'(.*)heads\.(\d+)\.(query|key|value|tril)(\.weight)?$', name)
+        if m is None:
+            out[name] = w
+        elif m.group(3) != 'tril':
+            per_head.setdefault(m.group(1), {}).setdefault(m.group(3), {})[int(m.group(2))] = w
+    for prefix, kinds in per_head.items():
+        out[prefix + 'qkv.weight'] = torch.cat([kinds[kind][i] for kind in ('query', 'key', 'value')
+                                                for i in sorted(kinds[kind])])
+    return out
@@ -25,6 +25,7 @@ lr = 0.0005 if i < 10000 elif i < 3000 else 0.1
 
 
 import math
+import os
 import torch 
 import random
 import numpy as np
@@ -33,6 +34,9 @@ from matplotlib.colors import LogNorm
 import torch.nn.functional as F
 import torch.nn as nn
 
+from checkpoint_compat import convert_state_dict
+from data_loader import BatchLoader
+
 # Device configuration
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
@@ -50,87 +54,91 @@ iter_steps = 1000
 device = ('cuda' if torch.cuda.is_available()
           else 'mps' if torch.backends.mps.is_available()
           else 'cpu')
-print(f'Using device: {device}')   
 
 # --- not implamented
 # n_head = 6
 # n_layer = 6
 # eval_interval = 5
 # --- not implamented
-try:
-    ds = open('/Users/peternyman/Documents/GitHub/StreamRL/tiny-llm/traning_sets/input.txt', 'r', encoding='utf-8').read()
-except:
-    ds = open(r'C:\Users\peter\Documents\gpt\input.txt', 'r', encoding='utf-8').read()
-
-chars = sorted(list(set(ds)))
-vocab_size = len(chars)
-print("vocab_size:", vocab_size)
-
-# string -> index
-stoi = {s: i for i, s in enumerate(chars)}
-# index -> string
-itos = {i: s for i, s in enumerate(chars)}
-
-# text to list of int
-enconder = lambda s: [stoi[c] for c in s]
-decoder = lambda l: ''.join([itos[i] for i in l])
-
-print(enconder('I am an AI'))
-print(decoder([21, 1, 39, 51, 1, 39, 52, 1, 13, 21]))
-
-print(''.join(chars))
-
-def get_batch(ds):
-    X, Y = [], []
-    
-    ix = torch.randint(0, len(ds) - context_len -1, (batch_size,))
-    
-    for i in ix:
-        X.append([stoi[c] for c in ds[i : i+context_len]])
-        Y.append([stoi[c] for c in ds[i+1 : i+context_len+1]])
-    return torch.tensor(X), torch.tensor(Y)
-
-
-n1 = int(len(ds) * 0.9)
-
-dsTr = ds[:n1]
-dsDev = ds[n1:]
-
-X, Y = get_batch(dsTr)
+corpus_paths = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traning_sets', 'input.txt'),
+    '/Users/peternyman/Documents/GitHub/StreamRL/tiny-llm/traning_sets/input.txt',
+    r'C:\Users\peter\Documents\gpt\input.txt',
+]
+def encode_corpus(text, path, chars):
+    """Token ids of the whole corpus, cached as a .npy next to the text file and memory-mapped
+
+    Ids index into chars. The cache is rebuilt when the text file is newer than it.
+    """
+    cache = os.path.splitext(path)[0] + '.npy'
+    if not os.path.exists(cache) or os.path.getmtime(cache) < os.path.getmtime(path):
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        lut = np.zeros(int(codes.max()) + 1, dtype=np.uint8 if len(chars) <= 256 else np.uint16)
+        lut[[ord(c) for c in chars]] = np.arange(len(chars))
+        np.save(cache, lut[codes])
+    return np.load(cache, mmap_mode='r')
+
+
+offsets = np.arange(context_len + 1)
+
+def get_batch(data, generator=None):
+    """batch_size random windows of encoded data as (X, Y), Y shifted by one"""
+    ix = torch.randint(0, len(data) - context_len -1, (batch_size,), generator=generator).numpy()
+    chunk = torch.from_numpy(data[ix[:, None] + offsets].astype(np.int64))  # (B, context_len + 1)
+    return chunk[:, :-1].contiguous(), chunk[:, 1:].contiguous()
 
 
-class Head(nn.Module):
-    """Self-attention head"""
-    def __init__(self, n_emb, head_size):
+class MultiHeadAttention(nn.Module):
+    """Multiple self-attention heads in parallel, from one fused QKV projection"""
+    def __init__(self, n_emb, num_heads, head_size):
         super().__init__()
-        self.key = nn.Linear(n_emb, head_size, bias=False)
-        self.query = nn.Linear(n_emb, head_size, bias=False)
-        self.value = nn.Linear(n_emb, head_size, bias=False)
+        # rows: all heads' queries, then keys, then values
+        self.qkv = nn.Linear(n_emb, 3 * num_heads * head_size, bias=False)
+        self.num_heads = num_heads
         self.head_size = head_size
+        # causal mask, built once; follows the module across .to(device), not saved in checkpoints
+        self.register_buffer('tril', torch.tril(torch.ones(context_len, context_len, dtype=torch.bool)),
+                             persistent=False)
+
+    def split_heads(self, qkv):
+        """(B, T, 3 * num_heads * head_size) -> q, k, v each (B, num_heads, T, head_size)"""
+        B, T, _ = qkv.shape
+        return qkv.view(B, T, 3, self.num_heads, self.head_size).permute(2, 0, 3, 1, 4)
 
     def forward(self, x):
         B, T, C = x.shape
-        k = self.key(x)   # (B, T, head_size)
-        q = self.query(x) # (B, T, head_size)
-        wei = q @ k.transpose(-2, -1) * (self.head_size ** -0.5)  # (B, T, T)
+        q, k, v = self.split_heads(self.qkv(x))
 
-        tril = torch.tril(torch.ones(T, T, device=device))
-        wei = wei.masked_fill(tril == 0, float('-inf'))
-        wei = F.softmax(wei, dim=-1)
+        if hasattr(F, 'scaled_dot_product_attention'):
+            out = F.scaled_dot_product_attention(q, k, v, is_causal=True)
+        else:
+            wei = q @ k.transpose(-2, -1) * (self.head_size ** -0.5)  # (B, nh, T, T)
+            wei = wei.masked_fill(~self.tril[:T, :T], float('-inf'))
+            wei = F.softmax(wei, dim=-1)
+            out = wei @ v
 
-        v = self.value(x)
-        out = wei @ v
-        return out
+        return out.transpose(1, 2).reshape(B, T, self.num_heads * self.head_size)
 
 
-class MultiHeadAttention(nn.Module):
-    """Multiple self-attention heads in parallel"""
-    def __init__(self, n_emb, num_heads, head_size):
-        super().__init__()
-        self.heads = nn.ModuleList([Head(n_emb, head_size) for _ in range(num_heads)])
+class KVCache:
+    """Keys/values of the tokens in the current window, for incremental decoding
 
-    def forward(self, x):
-        return torch.cat([h(x) for h in self.heads], dim=-1)
+    The model feeds tok_emb + pos_emb straight into the bias-free QKV projection, so every
+    projection splits into a token part and a position part. Only the token parts are
+    cached: when the window slides past context_len every cached token moves down one
+    position, and its key is rebuilt by adding the precomputed position table instead of
+    re-running the projection.
+    """
+    def __init__(self, gpt):
+        mha = gpt.heads
+        pos_emb = gpt.position_embedding_table.weight  # (context_len, n_emb)
+        # (num_heads, context_len, head_size) each
+        self.pos_q, self.pos_k, self.pos_v = (t[0] for t in mha.split_heads(mha.qkv(pos_emb)[None]))
+        self.k = None  # token parts, (B, num_heads, T, head_size)
+        self.v = None
+
+    def __len__(self):
+        return 0 if self.k is None else self.k.shape[2]
 
 
 class GPT(nn.Module):
@@ -149,7 +157,7 @@ class GPT(nn.Module):
         B, T = X.shape
 
         tok_emb = self.token_embedding_table(X)
-        pos_emb = self.position_embedding_table(torch.arange(T, device=device))
+        pos_emb = self.position_embedding_table.weight[:T]  # rows for positions 0..T-1
         X = tok_emb + pos_emb
 
         X = self.heads.forward(X)
@@ -159,8 +167,53 @@ class GPT(nn.Module):
 
         return logits
 
-    def generate(self, idx, max_new_tokens):
+    def load_state_dict(self, state_dict, *args, **kwargs):
+        """Also accepts checkpoints saved before attention was fused (e.g. gpt_checkpoint.pt)"""
+        return super().load_state_dict(convert_state_dict(state_dict), *args, **kwargs)
+
+    def forward_cached(self, X, cache):
+        """Logits for the new tokens X (B, n), appending them to cache
+
+        Matches forward() over the last context_len tokens seen so far.
+        """
+        X = X[:, -context_len:]
+        n = X.shape[1]
+        tok_emb = self.token_embedding_table(X)
+        mha = self.heads
+
+        q, k, v = mha.split_heads(mha.qkv(tok_emb))  # (B, nh, n, hs)
+        if cache.k is not None:
+            k = torch.cat((cache.k, k), dim=2)
+            v = torch.cat((cache.v, v), dim=2)
+        cache.k, cache.v = k[:, :, -context_len:], v[:, :, -context_len:]
+        T = cache.k.shape[2]
+
+        # window positions restart at 0, as in forward() on the cropped context
+        k = cache.k + cache.pos_k[:, :T]
+        v = cache.v + cache.pos_v[:, :T]
+        q = q + cache.pos_q[:, T - n:T]
+        wei = q @ k.transpose(-2, -1) * (mha.head_size ** -0.5)  # (B, nh, n, T)
+
+        # new token r sits at position T-n+r and sees keys up to there
+        wei = wei.masked_fill(~mha.tril[T - n:T, :T], float('-inf'))
+        out = (F.softmax(wei, dim=-1) @ v).transpose(1, 2).reshape(X.shape[0], n, -1)
+
+        return self.lm_head(out)
+
+    @torch.no_grad()
+    def generate(self, idx, max_new_tokens, use_cache=True):
         """Generate new tokens autoregressively"""
+        if use_cache:
+            cache = KVCache(self)
+            logits = self.forward_cached(idx, cache)
+            for i in range(max_new_tokens):
+                probs = F.softmax(logits[:, -1, :], dim=-1)
+                idx_next = torch.multinomial(probs, num_samples=1)
+                idx = torch.cat((idx, idx_next), dim=1)
+                if i < max_new_tokens - 1:
+                    logits = self.forward_cached(idx_next, cache)
+            return idx
+
         for _ in range(max_new_tokens):
             idx_cond = idx[:, -context_len:]  # Crop to context length
 
@@ -180,8 +233,102 @@ class GPT(nn.Module):
         return idx
 
 
-# Only run training when this file is executed directly, not when imported
+@torch.no_grad()
+def benchmark_generate(model, max_new_tokens=500, start=0):
+    """Check cached logits against forward() on the same tokens and time both generate paths"""
+    import time
+    model.eval()
+    dev = next(model.parameters()).device
+    context = torch.tensor([[start]], dtype=torch.long, device=dev)
+
+    torch.manual_seed(0)
+    idx = model.generate(context, max_new_tokens)
+    cache = KVCache(model)
+    worst = 0.0
+    for t in range(1, idx.shape[1]):
+        cached = model.forward_cached(idx[:, :t] if t == 1 else idx[:, t-1:t], cache)[:, -1]
+        full = model(idx[:, :t][:, -context_len:])[:, -1]
+        worst = max(worst, (cached - full).abs().max().item())
+    print(f'max |logit diff| cached vs full over {idx.shape[1] - 1} steps: {worst:.2e}')
+
+    for use_cache in (False, True):
+        t0 = time.perf_counter()
+        model.generate(context, max_new_tokens, use_cache=use_cache)
+        elapsed = time.perf_counter() - t0
+        print(f'{"cached" if use_cache else "full  "}: {max_new_tokens / elapsed:8.1f} tokens/sec')
+
+
+def benchmark_train_step(model, batch=64, T=context_len, steps=10):
+    """Forward/backward throughput at batch x T tokens"""
+    import time
+    dev = next(model.parameters()).device
+    X = torch.randint(0, model.lm_head.out_features, (batch, T), device=dev)
+    Y = torch.randint(0, model.lm_head.out_features, (batch, T), device=dev)
+    model.train()
+    for i in range(steps + 1):
+        if i == 1:  # first step is warm-up
+            t0 = time.perf_counter()
+        logits = model(X)
+        loss = F.cross_entropy(logits.view(batch * T, -1), Y.view(batch * T))
+        model.zero_grad(set_to_none=True)
+        loss.backward()
+    elapsed = (time.perf_counter() - t0) / steps
+    print(f'fwd+bwd {batch}x{T}: {elapsed * 1e3:.1f} ms/step, {batch * T / elapsed:,.0f} tokens/sec')
+
+
+def profile_train_step(model, batch=64, T=context_len):
+    """Allocations in one forward/backward step, from the PyTorch profiler"""
+    from torch.profiler import profile, ProfilerActivity
+    dev = next(model.parameters()).device
+    X = torch.randint(0, model.lm_head.out_features, (batch, T), device=dev)
+    Y = torch.randint(0, model.lm_head.out_features, (batch, T), device=dev)
+    model.train()
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        logits = model(X)
+        loss = F.cross_entropy(logits.view(batch * T, -1), Y.view(batch * T))
+        model.zero_grad(set_to_none=True)
+        loss.backward()
+    events = prof.key_averages()
+    allocs = sum(e.count for e in events if e.key in ('aten::empty', 'aten::empty_strided'))
+    mask_ops = {e.key: e.count for e in events if e.key in ('aten::ones', 'aten::tril', 'aten::arange')}
+    allocated = sum(e.self_cpu_memory_usage for e in events if e.self_cpu_memory_usage > 0)
+    print(f'{allocs} tensor allocations, {allocated / 2**20:.1f} MiB allocated, mask/position ops: {mask_ops or "none"}')
+    print(events.table(sort_by='self_cpu_memory_usage', row_limit=8))
+
+
+# Only load the corpus and train when this file is executed directly, not when imported
+# (serve_gpt.py and load_gpt.py only need the model classes)
 if __name__ == "__main__":
+    print(f'Using device: {device}')
+    ds_path = next((p for p in corpus_paths if os.path.exists(p)), corpus_paths[-1])
+    ds = open(ds_path, 'r', encoding='utf-8').read()
+
+    chars = sorted(list(set(ds)))
+    vocab_size = len(chars)
+    print("vocab_size:", vocab_size)
+
+    # string -> index
+    stoi = {s: i for i, s in enumerate(chars)}
+    # index -> string
+    itos = {i: s for i, s in enumerate(chars)}
+
+    # text to list of int
+    enconder = lambda s: [stoi[c] for c in s]
+    decoder = lambda l: ''.join([itos[i] for i in l])
+
+    print(enconder('I am an AI'))
+    print(decoder([21, 1, 39, 51, 1, 39, 52, 1, 13, 21]))
+
+    print(''.join(chars))
+
+    data = encode_corpus(ds, ds_path, chars)
+    n1 = int(len(data) * 0.9)
+
+    dsTr = data[:n1]
+    dsDev = data[n1:]
+
+    X, Y = get_batch(dsTr)
+
     gpt = GPT(n_emb, num_heads, head_size, vocab_size).to(device)
     print([p.nelement() for p in gpt.parameters()])
     print(f'Model moved to {device}')
@@ -195,10 +342,11 @@ if __name__ == "__main__":
     steps = 0
 
     parameters = list(gpt.parameters())
+    # minibatches are built on a background thread while the previous step runs
+    loader = BatchLoader(lambda g: get_batch(dsTr, g), device=device)
     for i in range(iter_steps):
         # construct minibatch
-        Xb, Yb = get_batch(dsTr) # batch X,Y
-        Xb, Yb = Xb.to(device), Yb.to(device)
+        Xb, Yb = next(loader) # batch X,Y
         # forward pass
         logits = gpt.forward(Xb)
         B, T, C = logits.shape # Batch size X context length X Embedding dimension
@@ -225,6 +373,9 @@ if __name__ == "__main__":
         lrei.append(lre[i])
         lossi.append(loss.item())
 
+    loader.close()
+    print(f'waited {loader.wait_time:.2f}s for batches over {iter_steps} steps')
+
     # Save model checkpoint
     checkpoint = {
         'model_state_dict': gpt.state_dict(),
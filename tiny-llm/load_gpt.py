@@ -1,7 +1,7 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from gpt_model import GPT, Head, MultiHeadAttention, context_len
+from gpt_model import GPT, context_len
 
 # Set device
 device = 'cuda' if torch.cuda.is_available() else 'mps' if torch.backends.mps.is_available() else 'cpu'
@@ -0,0 +1,441 @@
+'''
+Local inference server for tiny-llm checkpoints.
+
+    python serve_gpt.py gpt_checkpoint.pt --port 8001
+
+Speaks enough of the OpenAI chat API (POST /v1/chat/completions, streamed or
+not, and GET /v1/models) for the openai client, so strm-RLVR's
+multi_agent_stream.Agent runs offline against our own model with
+OpenAI(base_url='http://127.0.0.1:8001/v1', api_key='local'). Whatever model
+name a request asks for, it gets the loaded one.
+
+The models are character level: the message contents, one per line, are the
+prompt, characters outside the vocabulary are dropped and every generated
+character is streamed as its own chunk.
+
+Requests are batched per decoding step (continuous batching): a new request is
+prefilled on its own and joins the running batch at the next step, each step
+samples one character for every running request, and a request leaves the
+batch as soon as it hits max_tokens (capped at --max-tokens-limit), one of its
+stop strings or the model's end token. Serves gpt_model checkpoints (fused or per-head layout) and MLP.py's
+mlp_ckpt.pt; gptAK checkpoints are not supported because gptAK.py trains
+when imported.
+'''
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+import uuid
+from collections import deque
+
+import torch
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__))) # tiny-llm/, for gpt_model
+
+# temperatures below this sample greedily; dividing by them can overflow the logits
+MIN_TEMPERATURE = 1e-4
+
+
+class GPTBackend:
+    """gpt_model.GPT with a KV cache row per batch slot
+
+    Every slot holds the token parts of its keys/values left-aligned in one
+    (max_batch, num_heads, context_len, head_size) buffer, as gpt_model.KVCache does
+    for a single sequence, plus its length; a step adds the position tables and masks
+    out each row's unused tail, so rows of any length share one attention call.
+    """
+    def __init__(self, checkpoint, max_batch, device):
+        from gpt_model import GPT, KVCache, context_len
+        hp = checkpoint['hyperparameters']
+        if hp.get('context_len', context_len) != context_len:
+            raise ValueError(f"checkpoint context_len {hp['context_len']} != gpt_model.context_len {context_len}")
+        self.model = GPT(hp['n_emb'], hp['num_heads'], hp['head_size'], hp['vocab_size']).to(device)
+        self.model.load_state_dict(checkpoint['model_state_dict'])
+        self.model.eval()
+        self.KVCache = KVCache
+        self.context_len = context_len
+        self.device = device
+
+        self.stoi = checkpoint['vocab']['stoi']
+        self.itos = checkpoint['vocab']['itos']
+        self.start_id = self.stoi.get('\n', 0) # context for an empty prompt
+        self.eos_id = None
+
+        with torch.no_grad():
+            self.pos = KVCache(self.model) # position tables
+        mha = self.model.heads
+        shape = (max_batch, mha.num_heads, context_len, mha.head_size)
+        self.k = torch.zeros(shape, device=device)
+        self.v = torch.zeros(shape, device=device)
+        self.lens = torch.zeros(max_batch, dtype=torch.long, device=device)
+
+    def prefill(self, slot, ids):
+        """Run the prompt ids into slot and return the logits for the next id"""
+        cache = self.KVCache(self.model)
+        idx = torch.tensor([ids], dtype=torch.long, device=self.k.device)
+        logits = self.model.forward_cached(idx, cache)
+        T = len(cache)
+        self.k[slot, :, :T] = cache.k[0]
+        self.v[slot, :, :T] = cache.v[0]
+        self.lens[slot] = T
+        return logits[0, -1]
+
+    def step(self, slots, ids):
+        """Append ids[i] to slots[i] and return the logits for the next id of every slot"""
+        mha = self.model.heads
+        L = self.context_len
+        B = len(slots)
+
+        q, k, v = mha.split_heads(mha.qkv(self.model.token_embedding_table(ids[:, None]))) # (B, nh, 1, hs)
+        full = slots[self.lens[slots] == L]
+        if len(full):
+            # a full window slides: every cached token moves down one position
+            self.k[full] = self.k[full].roll(-1, dims=2)
+            self.v[full] = self.v[full].roll(-1, dims=2)
+        at = torch.clamp(self.lens[slots], max=L - 1)
+        self.k[slots, :, at] = k[:, :, 0]
+        self.v[slots, :, at] = v[:, :, 0]
+        lens = at + 1
+        self.lens[slots] = lens
+
+        T = int(lens.max())
+        keys = self.k[slots, :, :T] + self.pos.pos_k[:, :T]
+        values = self.v[slots, :, :T] + self.pos.pos_v[:, :T]
+        q = q + self.pos.pos_q[:, at].transpose(0, 1)[:, :, None] # each row at its own position
+        wei = q @ keys.transpose(-2, -1) * (mha.head_size ** -0.5) # (B, nh, 1, T)
+        wei = wei.masked_fill((torch.arange(T, device=q.device) >= lens[:, None])[:, None, None], float('-inf'))
+        out = (F.softmax(wei, dim=-1) @ values).transpose(1, 2).reshape(B, -1)
+        return self.model.lm_head(out)
+
+
+class MLPBackend:
+    """The MLP.py character model: every slot is a MAXWCHARS window of ids"""
+    def __init__(self, checkpoint, max_batch, device):
+        self.C, self.W1, self.b1, self.W2, self.b2 = (checkpoint[k].to(device) for k in ('C', 'W1', 'b1', 'W2', 'b2'))
+        self.stoi, self.itos = checkpoint['stoi'], checkpoint['itos']
+        self.start_id = self.stoi['@']
+        self.eos_id = self.stoi['@'] # index 0 ends a sample
+        self.device = device
+        self.windows = torch.full((max_batch, checkpoint['MAXWCHARS']), self.stoi['*'], dtype=torch.long, device=device)
+
+    def forward(self, X):
+        emb = self.C[X]
+        h = torch.tanh(emb.view(emb.shape[0], emb.shape[1]*emb.shape[2]) @ self.W1 + self.b1)
+        return h @ self.W2 + self.b2
+
+    def prefill(self, slot, ids):
+        M = self.windows.shape[1]
+        ids = [self.start_id] + ids[-(M - 1):]
+        self.windows[slot] = self.stoi['*']
+        self.windows[slot, M - len(ids):] = torch.tensor(ids, device=self.windows.device)
+        return self.forward(self.windows[slot:slot + 1])[0]
+
+    def step(self, slots, ids):
+        self.windows[slots] = torch.cat((self.windows[slots, 1:], ids[:, None]), dim=1)
+        return self.forward(self.windows[slots])
+
+
+def load_backend(path, max_batch=32, device='cpu'):
+    """The backend matching a tiny-llm checkpoint file"""
+    checkpoint = torch.load(path, map_location=device, weights_only=False)
+    if 'model_state_dict' in checkpoint and 'n_emb' in checkpoint.get('hyperparameters', {}):
+        return GPTBackend(checkpoint, max_batch, device)
+    if 'W1' in checkpoint and 'MAXWCHARS' in checkpoint:
+        return MLPBackend(checkpoint, max_batch, device)
+    raise ValueError(f'{path} is not a gpt_model or MLP.py checkpoint')
+
+
+class Request:
+    """One completion: its prompt ids, stop conditions and the chars to send back"""
+    def __init__(self, ids, max_tokens=256, temperature=1.0, stop=()):
+        self.ids = ids
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stop = [s for s in stop if s]
+        self.text = '' # everything generated so far
+        self.sent = 0 # chars of text already handed out
+        self.tokens = 0
+        self.last = None # id to feed at the next step
+        self.slot = None
+        self.finish_reason = None
+        self.cancelled = False # set when the client goes away
+        self.queue = asyncio.Queue() # pieces of text, then None
+
+    def add(self, char):
+        """Append a generated char; returns True when a stop string completed"""
+        self.text += char
+        self.tokens += 1
+        for s in self.stop:
+            i = self.text.find(s, max(0, len(self.text) - len(char) - len(s)))
+            if i >= 0:
+                self.text = self.text[:i] # stop strings are not part of the reply
+                return True
+        return False
+
+    def flush(self, final=False):
+        """Queue the text that can no longer turn out to be the start of a stop string"""
+        end = len(self.text)
+        if not final:
+            for s in self.stop:
+                for n in range(min(len(s) - 1, end - self.sent), 0, -1):
+                    if self.text.endswith(s[:n]):
+                        end = min(end, len(self.text) - n)
+                        break
+        if end > self.sent:
+            self.queue.put_nowait(self.text[self.sent:end])
+            self.sent = end
+
+
+class Engine:
+    """Continuous batching over a backend; run() is the decoding loop"""
+    def __init__(self, backend, max_batch=32):
+        self.backend = backend
+        self.pending = deque()
+        self.active = {} # slot -> Request
+        self.free = list(range(max_batch))[::-1]
+        self.wakeup = asyncio.Event()
+        self.steps = 0
+        self.batched = 0 # sum of batch sizes over steps
+
+    def submit(self, req):
+        self.pending.append(req)
+        self.wakeup.set()
+
+    @torch.no_grad()
+    def _forward(self, admit, running):
+        """Prefill admitted requests, step the running ones and sample the next id for all"""
+        b = self.backend
+        logits = [b.prefill(req.slot, req.ids or [b.start_id]) for req in admit]
+        if running:
+            slots = torch.tensor([req.slot for req in running], device=b.device)
+            ids = torch.tensor([req.last for req in running], device=b.device)
+            logits.extend(b.step(slots, ids))
+        logits = torch.stack(logits).float()
+
+        temps = torch.tensor([req.temperature for req in admit + running], device=logits.device)
+        greedy = logits.argmax(-1)
+        probs = F.softmax(logits / temps.clamp(min=MIN_TEMPERATURE)[:, None], dim=-1)
+        sampled = torch.multinomial(probs, num_samples=1)[:, 0]
+        return torch.where(temps >= MIN_TEMPERATURE, sampled, greedy).tolist()
+
+    def _finish(self, req, reason):
+        req.finish_reason = reason
+        req.flush(final=True)
+        req.queue.put_nowait(None)
+        if req.slot is not None:
+            del self.active[req.slot]
+            self.free.append(req.slot)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            for req in [r for r in self.active.values() if r.cancelled]:
+                self._finish(req, 'cancelled')
+            if not self.active and not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+
+            admit = []
+            while self.pending and self.free:
+                req = self.pending.popleft()
+                if not req.cancelled:
+                    req.slot = self.free.pop()
+                    self.active[req.slot] = req
+                    admit.append(req)
+            running = [r for r in self.active.values() if r not in admit]
+            if not admit and not running:
+                continue
+
+            # the model runs off the event loop, so clients keep being served meanwhile
+            try:
+                next_ids = await loop.run_in_executor(None, self._forward, admit, running)
+            except Exception as e:
+                print(f'decoding step failed: {e!r}')
+                for req in admit + running:
+                    self._finish(req, 'error')
+                continue
+            self.steps += 1
+            self.batched += len(next_ids)
+
+            for req, i in zip(admit + running, next_ids):
+                req.last = i
+                try:
+                    if i == self.backend.eos_id:
+                        self._finish(req, 'stop')
+                    elif req.add(self.backend.itos[i]):
+                        self._finish(req, 'stop')
+                    elif req.tokens >= req.max_tokens:
+                        self._finish(req, 'length')
+                    else:
+                        req.flush()
+                except Exception as e: # only this request is affected, the loop keeps running
+                    print(f'request failed: {e!r}')
+                    if req.finish_reason is None:
+                        self._finish(req, 'error')
+
+
+def prompt_text(messages):
+    """Message contents one per line, ending in a newline for the reply to start on"""
+    lines = []
+    for m in messages:
+        content = m.get('content') or ''
+        if isinstance(content, list): # content parts
+            content = ''.join(p.get('text', '') for p in content if isinstance(p, dict))
+        lines.append(str(content))
+    return '\n'.join(lines) + '\n'
+
+
+class InferenceServer:
+    """asyncio HTTP front end: OpenAI-style chat completions over an Engine"""
+    def __init__(self, backend, model_name, max_batch=32, max_tokens=256, max_tokens_limit=2048):
+        self.backend = backend
+        self.model_name = model_name
+        self.engine = Engine(backend, max_batch)
+        self.max_tokens = max_tokens
+        self.max_tokens_limit = max_tokens_limit
+
+    def make_request(self, body):
+        messages = body.get('messages')
+        if not isinstance(messages, list) or not messages:
+            raise ValueError('messages must be a non-empty list')
+        stop = body.get('stop') or []
+        stop = [stop] if isinstance(stop, str) else stop
+        if not isinstance(stop, list) or not all(isinstance(s, str) for s in stop):
+            raise ValueError('stop must be a string or a list of strings')
+        ids = [self.backend.stoi[c] for c in prompt_text(messages) if c in self.backend.stoi]
+        max_tokens = int(body.get('max_tokens') or self.max_tokens)
+        if max_tokens < 1:
+            raise ValueError('max_tokens must be at least 1')
+        temperature = float(body.get('temperature', 1.0))
+        if not math.isfinite(temperature) or temperature < 0:
+            raise ValueError('temperature must be a finite number >= 0')
+        # one request must not hold a batch slot indefinitely
+        return Request(ids, min(max_tokens, self.max_tokens_limit), temperature, stop)
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length') or 0))
+            path = path.split('?')[0].rstrip('/')
+
+            if method == 'GET' and path == '/v1/models':
+                await self.send_json(writer, 200, {'object': 'list', 'data': [
+                    {'id': self.model_name, 'object': 'model', 'created': 0, 'owned_by': 'tiny-llm'}]})
+            elif method == 'POST' and path == '/v1/chat/completions':
+                try:
+                    body = json.loads(body or b'{}')
+                    req = self.make_request(body)
+                except (ValueError, TypeError, AttributeError, OverflowError) as e:
+                    await self.send_json(writer, 400, {'error': {'message': str(e), 'type': 'invalid_request_error'}})
+                    return
+                await self.complete(writer, req, bool(body.get('stream')))
+            else:
+                await self.send_json(writer, 404, {'error': {'message': f'no route for {method} {path}', 'type': 'not_found'}})
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def send_json(self, writer, status, obj):
+        data = json.dumps(obj).encode('utf-8')
+        writer.write(f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                     'Content-Type: application/json\r\n'
+                     f'Content-Length: {len(data)}\r\n'
+                     'Connection: close\r\n\r\n'.encode('latin-1') + data)
+        await writer.drain()
+
+    async def complete(self, writer, req, stream):
+        self.engine.submit(req)
+        cid = f'chatcmpl-{uuid.uuid4().hex}'
+        created = int(time.time())
+        try:
+            if not stream:
+                while await req.queue.get() is not None:
+                    pass
+                await self.send_json(writer, 200, {
+                    'id': cid, 'object': 'chat.completion', 'created': created, 'model': self.model_name,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': req.text},
+                                 'finish_reason': req.finish_reason}],
+                    'usage': {'prompt_tokens': len(req.ids), 'completion_tokens': req.tokens,
+                              'total_tokens': len(req.ids) + req.tokens}})
+                return
+
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                         b'Cache-Control: no-cache\r\nConnection: close\r\n\r\n')
+            chunk = lambda delta, reason=None: ('data: ' + json.dumps({
+                'id': cid, 'object': 'chat.completion.chunk', 'created': created, 'model': self.model_name,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': reason}]}) + '\n\n').encode('utf-8')
+            writer.write(chunk({'role': 'assistant', 'content': ''}))
+            while (piece := await req.queue.get()) is not None:
+                for char in piece:
+                    writer.write(chunk({'content': char}))
+                await writer.drain()
+            writer.write(chunk({}, req.finish_reason) + b'data: [DONE]\n\n')
+            await writer.drain()
+        finally:
+            req.cancelled = True # frees the slot if the client left early; no-op once finished
+
+    async def serve(self, host='127.0.0.1', port=8001):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f'serving {self.model_name} on http://{host}:{port}/v1')
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.engine.run())
+
+
+def benchmark(path, requests=16, max_tokens=200):
+    """Chars/sec for concurrent requests decoded one at a time vs in one batch"""
+    async def run(max_batch):
+        backend = load_backend(path, max_batch)
+        engine = Engine(backend, max_batch)
+        task = asyncio.ensure_future(engine.run())
+        reqs = [Request([backend.start_id], max_tokens, 1.0) for _ in range(requests)]
+        t0 = time.perf_counter()
+        for req in reqs:
+            engine.submit(req)
+        for req in reqs:
+            while await req.queue.get() is not None:
+                pass
+        elapsed = time.perf_counter() - t0
+        task.cancel()
+        chars = sum(r.tokens for r in reqs)
+        print(f'max_batch={max_batch:3d}: {chars} chars in {elapsed:.2f}s, {chars / elapsed:,.0f} chars/sec, '
+              f'{engine.batched / engine.steps:.1f} requests per step')
+
+    for max_batch in (1, requests):
+        asyncio.run(run(max_batch))
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='OpenAI-style chat completions from a tiny-llm checkpoint')
+    parser.add_argument('checkpoint', nargs='?', default=os.path.join(here, 'gpt_checkpoint.pt'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--max-batch', type=int, default=32, help='requests decoded together per step')
+    parser.add_argument('--max-tokens', type=int, default=256, help='default when a request sets none')
+    parser.add_argument('--max-tokens-limit', type=int, default=2048, help='requests asking for more get this many')
+    parser.add_argument('--benchmark', action='store_true', help='time batched vs one-at-a-time decoding and exit')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.checkpoint)
+    else:
+        device = ('cuda' if torch.cuda.is_available()
+                  else 'mps' if torch.backends.mps.is_available()
+                  else 'cpu')
+        backend = load_backend(args.checkpoint, args.max_batch, device)
+        server = InferenceServer(backend, os.path.splitext(os.path.basename(args.checkpoint))[0],
+                                 args.max_batch, args.max_tokens, args.max_tokens_limit)
+        asyncio.run(server.serve(args.host, args.port))
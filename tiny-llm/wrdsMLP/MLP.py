@@ -8,8 +8,12 @@ import torch.nn.functional as F
 from itertools import islice
 import random
 import unicodedata
+import sys
 
 import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # tiny-llm/, for data_loader
+from data_loader import BatchLoader
+from wrds_data import TokenStore, build_token_store
 os.system('clear')
 os.system('clear')
 
@@ -25,36 +29,17 @@ MAXWRDS = 100
 INTER_LAYER = 1000
 N = 120000
 
-interwrds = ' \n".,?!:;=@-'
-trash = '€â»«˜œ™'
-
-table = {ord(c) : None for c in trash}
-
-
-def norm_text(text):
-    spaces = [i for i, char in enumerate(text) if char in interwrds]
-    spaces.insert(0,-1)
-    spaces.append(len(text))
-
-    return [text[spaces[i-1]+1:spaces[i]].lower().translate(table) for i in range(1,len(spaces)) if text[spaces[i-1]+1:spaces[i]] != '']
-
-from datasets import load_dataset
-# ds = load_dataset("roneneldan/TinyStories", split="train")
-ds = load_dataset("Salesforce/wikitext", "wikitext-103-raw-v1", split="train")
-print('Loaded Dataset')
-
-wrd_set = []
-for ex in islice(ds, N):
-    wrd_set.extend(norm_text(ex['text']))  # flatten token lists
-wrds = sorted(set(wrd_set))
-# Ensure special tokens and keep them distinct
-for tok in ['<PAD>', '<BOS>', '<EOS>']:
-    if tok in wrds:
-        wrds.remove(tok)
-wrds.insert(0, '<PAD>')
-wrds.insert(1, '<BOS>')
-wrds.insert(2, '<EOS>')
-print('Built token vocab')
+# Tokenized once into a memory-mapped store (see wrds_data.py); built here on first run
+store_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tokens')
+if not os.path.isdir(store_dir):
+    from datasets import load_dataset
+    # ds = load_dataset("roneneldan/TinyStories", split="train")
+    ds = load_dataset("Salesforce/wikitext", "wikitext-103-raw-v1", split="train")
+    print('Loaded Dataset')
+    build_token_store((ex['text'] for ex in islice(ds, N)), store_dir)
+store = TokenStore(store_dir)
+wrds = store.wrds
+print('Loaded token store')
 
 
 
@@ -74,38 +59,9 @@ parameters = [C,W1,b1,W2,b2]
 
 
 "traning"
-def sample_batch(batch_size=32):
-    Xb = torch.zeros((batch_size, MAXWRDS), dtype=torch.long).to(device)
-    Yb = torch.zeros((batch_size,), dtype=torch.long).to(device)
-
-    idxs = [random.randrange(N) for _ in range(batch_size)]
-
-    for i in range(batch_size):
-        # resample until we get enough tokens
-        while True:
-            idx = random.randrange(N)
-            toks_core = norm_text(ds[idx]["text"])  # list of tokens
-            if len(toks_core) >= 10:
-                break
-
-        toks = ['<BOS>'] + toks_core + ['<EOS>']
-
-        # choose k with a right-tail bias, but enforce a minimum context length
-        min_k = min(len(toks) - 1, max(10, MAXWRDS // 2))
-        k = random.choices(range(min_k, len(toks)),
-                           weights=[j*j for j in range(min_k, len(toks))],
-                           k=1)[0]
-
-        start = max(0, k - MAXWRDS)
-        window = toks[start:k]
-
-        # left-pad with <PAD> to fixed length
-        if len(window) < MAXWRDS:
-            window = ['<PAD>'] * (MAXWRDS - len(window)) + window
-
-        Xb[i] = torch.tensor([wtoi.get(t, wtoi['<PAD>']) for t in window], dtype=torch.long).to(device)
-        Yb[i] = wtoi.get(toks[k], wtoi['<PAD>'])
-    return Xb, Yb
+def sample_batch(batch_size=32, generator=None):
+    Xb, Yb = store.sample(batch_size, MAXWRDS, generator)
+    return Xb.to(device), Yb.to(device)
 
 lre = torch.linspace(-3, 0, 10000)
 lrs = 10**lre
@@ -116,8 +72,11 @@ lossi = []
 for p in parameters:
     p.requires_grad = True
 
+# minibatches are built on a background thread while the previous step runs
+loader = BatchLoader(lambda g: store.sample(32, MAXWRDS, g), device=device)
+
 for i in range(3000):
-    Xb, Yb = sample_batch(32)
+    Xb, Yb = next(loader)
 
     # [print(f"-------------------\n{' '.join(itow[int(idx)] for idx in row)}") for row in Xb.detach().cpu().tolist()]
 
@@ -148,6 +107,7 @@ for i in range(3000):
     print(f"---\n{lr}: {loss.item():4f}")
     lossi.append(loss.item())
 
+loader.close()
 
 # quick validation on a sampled batch
 Xv, Yv = sample_batch(512)